@@ -1,17 +1,38 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import Response, JSONResponse
-from typing import List
-import io
+from fastapi import APIRouter, File, UploadFile, HTTPException, Request
+from fastapi.responses import Response, FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from typing import Callable, List, Optional, Tuple
+from contextlib import contextmanager
+import asyncio
+import functools
 import base64
+import hmac
+import json
 import zipfile
 import os
+import time
+import threading
 import torch
 import logging
 from PIL import Image
 
 # Import from our new structure
-from app.core.model import BackgroundRemover
+from app.core.model import BackgroundRemover, QUALITY_LEVELS
+from app.core.scheduler import BatchScheduler
+from app.core.encoding import (
+    MASK_FORMATS, OUTPUT_FORMATS, TRANSPORTS, EncodedResult, OutputOptions, base64_json_stream, check_mask_format,
+    check_output_format, encode_multipart, encode_result, encoder_options, negotiate_format
+)
+from app.core.executor import InferenceExecutor
+from app.core.workers import ProcessWorkerPool
+from app.core.cache import ResultCache
+from app.core.jobs import DONE, FAILED, QUEUED, JobRunner, JobStore, options_to_json
+from app.core.ingest import (
+    Base64Decoder, Upload, UploadRejected, ingest_base64, ingest_bytes, ingest_file, read_stream, read_upload
+)
+from app.core.composite import WHITE, Background
+from app.core.decode import DecodedImage
 from app.core.config import settings
+from app.core import metrics, profiling
 
 logger = logging.getLogger(__name__)
 
@@ -19,125 +40,584 @@ router = APIRouter()
 
 # Global instance
 bg_remover = None
+batch_scheduler = None
+inference_executor = None
+worker_pool = None
+job_runner = None
+# Caches encoded HTTP responses; created on first use, None when CACHE_ENABLED is off
+result_cache = None
+_result_cache_created = False
+
+# Startup warmup state, reported by /ready
+readiness = {
+    "ready": False,
+    "warmup_seconds": None,
+    "error": None
+}
+
+_remover_lock = threading.Lock()
+_jobs_lock = threading.Lock()
+_pool_lock = threading.Lock()
+_cache_lock = threading.Lock()
+# Set while the startup warmup is loading the model
+_warming = threading.Event()
 
 def get_remover():
     global bg_remover
     if bg_remover is None:
-        bg_remover = BackgroundRemover()
+        with _remover_lock:
+            if bg_remover is None:
+                bg_remover = BackgroundRemover()
     return bg_remover
 
+def warm_up():
+    """Load the model and run the warmup inferences (blocking)"""
+    try:
+        start = time.perf_counter()
+        pool = get_worker_pool()
+        if pool is not None:
+            pool.warmup()
+        elif settings.BATCHING_ENABLED:
+            # Inference runs on the scheduler's thread, warm that one up
+            get_scheduler().call(get_remover().warmup).result()
+        else:
+            get_executor().submit(get_remover().warmup).result()
+        readiness["warmup_seconds"] = round(time.perf_counter() - start, 3)
+        readiness["ready"] = True
+    except Exception as e:
+        logger.error(f"Warmup failed: {e}", exc_info=True)
+        readiness["error"] = str(e)
+    finally:
+        _warming.clear()
+
+def start_warmup():
+    """Run warm_up on a background thread; processing requests get 503 until it is done"""
+    # The lifespan can run again in one process (the desktop app restarts the API)
+    readiness.update(ready=False, warmup_seconds=None, error=None)
+    _warming.set()
+    return asyncio.get_running_loop().run_in_executor(None, warm_up)
+
+def get_scheduler():
+    global batch_scheduler
+    remover = get_remover()
+    if batch_scheduler is None or batch_scheduler.remover is not remover:
+        # The remover can be swapped at runtime (e.g. by the desktop app)
+        if batch_scheduler is not None:
+            batch_scheduler.shutdown(wait=False)
+        batch_scheduler = BatchScheduler(remover)
+    return batch_scheduler
+
+def get_executor():
+    global inference_executor
+    if inference_executor is None:
+        inference_executor = InferenceExecutor()
+    return inference_executor
+
+def get_worker_pool():
+    """Process pool used when SERVING_MODE is "process", otherwise None"""
+    global worker_pool
+    if worker_pool is None and settings.SERVING_MODE == "process":
+        with _pool_lock:
+            if worker_pool is None:
+                worker_pool = ProcessWorkerPool(get_remover())
+    return worker_pool
+
+def get_result_cache():
+    """Result cache of the HTTP endpoints, None when CACHE_ENABLED is off"""
+    global result_cache, _result_cache_created
+    if not _result_cache_created:
+        with _cache_lock:
+            if not _result_cache_created:
+                result_cache = ResultCache.from_settings()
+                _result_cache_created = True
+    return result_cache
+
+def get_job_runner():
+    """Runner for the asynchronous job API (resumes unfinished jobs when created)"""
+    global job_runner
+    if not settings.JOBS_ENABLED:
+        raise HTTPException(status_code=404, detail="Job API is disabled")
+    if job_runner is None:
+        with _jobs_lock:
+            if job_runner is None:
+                job_runner = JobRunner(JobStore(settings.JOBS_DIR), get_remover)
+    return job_runner
+
+def shutdown_services():
+    """Stop the job runner and the worker pool; the next lifespan (e.g. the desktop app
+    switching the API back on) creates fresh ones"""
+    global job_runner, worker_pool
+    with _jobs_lock:
+        if job_runner is not None:
+            job_runner.shutdown()
+            job_runner = None
+    with _pool_lock:
+        if worker_pool is not None:
+            worker_pool.shutdown()
+            worker_pool = None
+
+def server_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server busy, please retry later",
+        headers={"Retry-After": str(settings.RETRY_AFTER_SECONDS)}
+    )
+
+def require_ready():
+    """Reject with 503 while the model is still loading, instead of waiting on it from the event loop"""
+    if _warming.is_set():
+        raise HTTPException(
+            status_code=503,
+            detail="Model is warming up, please retry later",
+            headers={"Retry-After": str(settings.RETRY_AFTER_SECONDS)}
+        )
+
+@contextmanager
+def admit_request():
+    """Reserve a request slot on the executor, or reject with 503 when the queue is full"""
+    require_ready()
+    executor = get_executor()
+    if not executor.try_acquire():
+        raise server_busy()
+    try:
+        yield
+    finally:
+        executor.release()
+
+def validate_options(
+    output_format: str, quality: str, return_mask: bool = False, mask_format: str = "png",
+    mask_only: bool = False, transport: str = "json", background: Optional[str] = None
+) -> OutputOptions:
+    """Check request options up front, returns the normalized output options"""
+    if quality.lower() not in QUALITY_LEVELS:
+        raise HTTPException(status_code=400, detail=f"Unsupported quality: {quality}")
+    if transport.lower() not in TRANSPORTS:
+        raise HTTPException(status_code=400, detail=f"Unsupported transport: {transport}")
+    try:
+        output_format = check_output_format(output_format)
+        parsed = Background.parse(background) if background else None
+        if parsed is None and OUTPUT_FORMATS[output_format][0] == "JPEG":
+            # JPEG has no alpha: blend onto white straight from the mask
+            parsed = WHITE
+        return OutputOptions(output_format, return_mask or mask_only, check_mask_format(mask_format), mask_only, parsed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def with_background_image(options: OutputOptions, upload: Optional[Upload]) -> OutputOptions:
+    """Decode an uploaded background image into the options (it replaces any background color)"""
+    if upload is None:
+        return options
+    try:
+        image = await get_executor().run(decode_image, upload)
+    finally:
+        upload.close()
+    return options._replace(background=Background.from_image(image.full(), upload.digest))
+
+def encoding_headers(encoded: EncodedResult, options: OutputOptions) -> dict:
+    """Report the chosen formats, payload sizes and encode time of a single result"""
+    headers = {}
+    if not options.mask_only:
+        headers["X-Output-Format"] = options.output_format
+        headers["X-Output-Bytes"] = str(len(encoded.result))
+    if encoded.mask is not None:
+        headers["X-Mask-Format"] = options.mask_format
+        headers["X-Mask-Bytes"] = str(len(encoded.mask))
+        if encoded.size is not None:
+            # (height, width) of the uint8 array, needed to read "raw" masks
+            headers["X-Mask-Shape"] = f"{encoded.size[1]},{encoded.size[0]}"
+    if encoded.encode_seconds is not None:
+        headers["X-Encode-Time-Ms"] = f"{encoded.encode_seconds * 1000:.1f}"
+    return headers
+
+def json_mask(encoded: EncodedResult, options: OutputOptions):
+    """The mask for a JSON response: RLE as an object, other formats base64 encoded"""
+    if options.mask_format == "rle":
+        return json.loads(encoded.mask)
+    return base64.b64encode(encoded.mask).decode()
+
+def binary_response(encoded: EncodedResult, options: OutputOptions, transport: str, filename: str, headers: dict) -> Optional[Response]:
+    """Mask-only or multipart/mixed response, None when the endpoint answers as usual"""
+    mask_type, mask_extension = MASK_FORMATS[options.mask_format]
+    if options.mask_only:
+        return Response(content=encoded.mask, media_type=mask_type, headers=headers)
+    if options.return_mask and transport.lower() == "multipart":
+        base_name = os.path.splitext(filename)[0]
+        body, content_type = encode_multipart([
+            ("result", f"no_bg_{base_name}.{encoded.extension}", encoded.media_type, encoded.result),
+            ("mask", f"mask_{base_name}.{mask_extension}", mask_type, encoded.mask),
+        ])
+        return Response(content=body, media_type=content_type, headers=headers)
+    return None
+
+def single_response(encoded: EncodedResult, options: OutputOptions, transport: str, filename: str, headers: dict) -> Response:
+    """Response for one image: the encoded result, or JSON with result and mask"""
+    response = binary_response(encoded, options, transport, filename, headers)
+    if response is not None:
+        return response
+    if options.return_mask:
+        return JSONResponse({
+            "result": base64.b64encode(encoded.result).decode(),
+            "mask": json_mask(encoded, options),
+            "format": options.output_format,
+            "mask_format": options.mask_format,
+            "filename": filename
+        }, headers=headers)
+    return Response(content=encoded.result, media_type=encoded.media_type, headers=headers)
+
+def rejection(e: UploadRejected) -> HTTPException:
+    headers = {"Retry-After": str(settings.RETRY_AFTER_SECONDS)} if e.status_code == 503 else None
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+async def ingest_files(files: List[UploadFile]) -> List[Upload]:
+    """Spool and header-check every upload, rejecting the request on the first bad one"""
+    uploads = []
+    try:
+        for file in files:
+            with metrics.stage("read"):
+                upload = await read_upload(file)
+            uploads.append(upload)
+            metrics.INPUT_MEGAPIXELS.observe(upload.width * upload.height / 1e6)
+    except UploadRejected as e:
+        for upload in uploads:
+            upload.close()
+        raise rejection(e)
+    return uploads
+
+async def ingest_stream(request: Request, filename: Optional[str] = None, decoder: Optional[Base64Decoder] = None) -> Upload:
+    """Spool and header-check a raw request body while it arrives"""
+    try:
+        with metrics.stage("read"):
+            upload = await read_stream(request.stream(), filename, decoder)
+    except UploadRejected as e:
+        raise rejection(e)
+    metrics.INPUT_MEGAPIXELS.observe(upload.width * upload.height / 1e6)
+    return upload
+
+def decode_image(upload: Upload, input_size: Optional[int] = None) -> DecodedImage:
+    """Decode an upload on the calling worker thread: at about input_size when given, otherwise fully.
+
+    The full resolution of a downscaled decode is only read when it is composited.
+    """
+    image = DecodedImage(upload.open())
+    if input_size:
+        image.preview(input_size)
+    else:
+        image.full()
+    return image
+
+async def predict_mask(image: DecodedImage, input_size: int) -> Image.Image:
+    """Predict the mask, batching with concurrent requests when enabled.
+
+    Compositing is left to the request's own worker thread (see render_result).
+    """
+    if not settings.BATCHING_ENABLED:
+        _, mask_image = await get_executor().run(
+            get_remover().remove_background, image, return_mask=True, input_size=input_size, composite=False
+        )
+        return mask_image
+    future = get_scheduler().submit(image, return_mask=True, input_size=input_size, composite=False)
+    _, mask_image = await asyncio.wrap_future(future)
+    return mask_image
+
+def render_result(image: DecodedImage, mask_image: Image.Image, options: OutputOptions) -> EncodedResult:
+    """Composite (decoding the full resolution now) and encode, unless only the mask is wanted"""
+    result_image = None if options.mask_only else get_remover().apply_mask(image, mask_image, options.background)
+    return encode_result(
+        result_image, options.output_format, mask_image if options.return_mask else None,
+        options.mask_format, options.mask_only
+    )
+
+async def process_upload(upload: Upload, options: OutputOptions, quality: Optional[str] = None) -> EncodedResult:
+    """Decode, remove background and encode one upload, using the result cache"""
+    executor = get_executor()
+    # Loads the model on first use, which must not happen on the event loop
+    remover = await executor.run(get_remover)
+    # The resolution is chosen from the probed header, so it is known before decoding
+    load = executor.in_flight / executor.capacity
+    input_size = remover.select_input_size((upload.width, upload.height), quality, load)
+
+    cache = get_result_cache()
+    if cache is not None:
+        key = remover.cache_key(upload.digest, input_size, encoder=encoder_options(options.output_format), **options._asdict())
+        cached = await executor.run(cache.get, key)
+        if cached is not None:
+            return cached._replace(encode_seconds=None)
+
+    pool = get_worker_pool()
+    if pool is not None:
+        contents = await executor.run(upload.read)
+        encoded = await asyncio.wrap_future(pool.submit(contents, options, input_size))
+    else:
+        image = await executor.run(decode_image, upload, input_size)
+        mask_image = await predict_mask(image, input_size)
+        encoded = await executor.run(render_result, image, mask_image, options)
+
+    if cache is not None:
+        await executor.run(cache.put, key, encoded)
+    if not options.mask_only:
+        metrics.OUTPUT_BYTES.observe(len(encoded.result), options.output_format)
+    return encoded
+
+def is_admin(request: Request) -> bool:
+    """Whether the request carries the configured admin token (never true without one)"""
+    token = request.headers.get("X-Admin-Token")
+    return bool(settings.ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, settings.ADMIN_TOKEN)
+
+def wants_profile(request: Request, profile: bool) -> bool:
+    """Whether this request asked to be profiled (ignored unless PROFILING_ENABLED and sent with the admin token)"""
+    if not settings.PROFILING_ENABLED:
+        return False
+    asked = profile or request.headers.get("X-RMBG-Profile", "").lower() in ("1", "true", "yes")
+    return asked and is_admin(request)
+
+async def process_profiled(ingest: Callable[[], Upload], options: OutputOptions, quality: Optional[str] = None) -> Tuple[EncodedResult, dict]:
+    """Ingest and process one image synchronously on one worker thread under the profilers.
+
+    ingest (e.g. ``functools.partial(ingest_bytes, data)``) runs inside the
+    profile, so it covers the whole ingest -> decode -> remove_background -> encode
+    path; the cache, scheduler and process pool are bypassed. Returns the result
+    and its response headers, including X-Profile-Id.
+    """
+    remover = await get_executor().run(get_remover)
+
+    def run() -> EncodedResult:
+        upload = ingest()
+        try:
+            logger.info(f"Profiling {upload.filename} ({upload.width}x{upload.height} {upload.format})")
+            input_size = remover.select_input_size((upload.width, upload.height), quality)
+            image = decode_image(upload, input_size)
+            _, mask_image = remover.remove_background(image, return_mask=True, input_size=input_size, composite=False)
+            return render_result(image, mask_image, options)
+        finally:
+            upload.close()
+
+    try:
+        encoded, profile_id = await get_executor().run(profiling.profile_call, run)
+    except UploadRejected as e:
+        raise rejection(e)
+    headers = encoding_headers(encoded, options)
+    headers["X-Profile-Id"] = profile_id
+    return encoded, headers
+
+async def process_single(upload: Upload, options: OutputOptions, quality: str) -> Tuple[EncodedResult, dict]:
+    """Process one upload and close it, returns the result and its response headers"""
+    try:
+        encoded = await process_upload(upload, options, quality)
+    finally:
+        upload.close()
+    return encoded, encoding_headers(encoded, options)
+
+class ZipStream:
+    """Write-only, non-seekable sink for zipfile that hands out what was written so far"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _zip_entry(name: str) -> zipfile.ZipInfo:
+    # PNG/JPEG data is already compressed, deflating it again only costs CPU
+    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    return info
+
+async def stream_zip(uploads: List[Upload], options: OutputOptions, quality: Optional[str] = None):
+    """Yield a ZIP archive entry by entry, as soon as each image is processed.
+
+    Up to BATCH_MAX_SIZE images are in flight so the scheduler can still batch
+    them; the request slot reserved by the caller is released at the end.
+    """
+    async def process(upload: Upload):
+        try:
+            return upload.filename, await process_upload(upload, options, quality), None
+        except Exception as e:
+            logger.error(f"Error processing {upload.filename}: {e}", exc_info=True)
+            return upload.filename, None, e
+        finally:
+            upload.close()
+
+    mask_extension = MASK_FORMATS[options.mask_format][1]
+    stream = ZipStream()
+
+    def write_entries(zip_file: zipfile.ZipFile, filename: str, encoded: Optional[EncodedResult], error: Optional[Exception]) -> bytes:
+        base_name = os.path.splitext(filename)[0]
+        if error is not None:
+            # Headers are already sent, so report the failure inside the archive
+            zip_file.writestr(f"error_{base_name}.txt", f"Processing error: {error}")
+        else:
+            if not options.mask_only:
+                zip_file.writestr(_zip_entry(f"no_bg_{base_name}.{encoded.extension}"), encoded.result)
+            if options.return_mask:
+                zip_file.writestr(_zip_entry(f"mask_{base_name}.{mask_extension}"), encoded.mask)
+        return stream.drain()
+
+    executor = get_executor()
+    pending = set()
+    try:
+        with zipfile.ZipFile(stream, "w") as zip_file:
+            remaining = iter(uploads)
+            while True:
+                for upload in remaining:
+                    pending.add(asyncio.ensure_future(process(upload)))
+                    if len(pending) >= settings.BATCH_MAX_SIZE:
+                        break
+                if not pending:
+                    break
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # CRC32 and copying the entry run on a worker thread, not the event loop
+                    yield await executor.run(write_entries, zip_file, *task.result())
+        # Central directory
+        yield stream.drain()
+    finally:
+        for task in pending:
+            task.cancel()
+        for upload in uploads:
+            upload.close()
+        executor.release()
+
 @router.get("/health")
 async def health_check():
-    remover = get_remover()
+    """Liveness: answers without touching the model"""
     status = {
         "status": "healthy",
         "model": settings.MODEL_ID,
-        "device": str(remover.device),
+        "device": str(bg_remover.device) if bg_remover is not None else settings.DEVICE,
+        "model_loaded": bg_remover is not None,
+        "precision": bg_remover.precision if bg_remover is not None else settings.PRECISION,
         "cuda_available": torch.cuda.is_available()
     }
-    logger.info(f"Health check: {status}")
+    if result_cache is not None:
+        status["cache"] = result_cache.stats()
+    if inference_executor is not None:
+        status["in_flight"] = inference_executor.in_flight
     return status
 
+def _cache_stat(name: str):
+    def read():
+        if result_cache is None:
+            return None
+        return result_cache.stats()[name]
+    return read
+
+metrics.register(metrics.Gauge(
+    "rmbg_in_flight_requests", "Requests holding an executor slot",
+    lambda: inference_executor.in_flight if inference_executor is not None else 0
+))
+metrics.register(metrics.Gauge("rmbg_cache_hits_total", "Result cache hits", _cache_stat("hits"), kind="counter"))
+metrics.register(metrics.Gauge("rmbg_cache_misses_total", "Result cache misses", _cache_stat("misses"), kind="counter"))
+metrics.register(metrics.Gauge("rmbg_cache_disk_hits_total", "Result cache hits served from disk", _cache_stat("disk_hits"), kind="counter"))
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/ready")
+async def readiness_check():
+    """Readiness: 200 only once the model is loaded and warmed up"""
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+def check_admin(request: Request):
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints need RMBG_ADMIN_TOKEN to be configured")
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@router.get("/admin/profiles")
+async def list_profiles(request: Request):
+    """Saved request profiles, newest first"""
+    check_admin(request)
+    return {"profiles": profiling.list_profiles()}
+
+@router.get("/admin/profiles/{profile_id}/{artifact}")
+async def download_profile(profile_id: str, artifact: str, request: Request):
+    """Download a Chrome trace (trace.json, open in chrome://tracing or Perfetto) or cProfile stats (pstats)"""
+    check_admin(request)
+    path = profiling.artifact_path(profile_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type=profiling.ARTIFACTS[artifact], filename=path.name)
+
 @router.post("/remove-bg")
 async def remove_background_endpoint(
+    request: Request,
     files: List[UploadFile] = File(...),
     return_mask: bool = False,
-    output_format: str = "png"
+    output_format: Optional[str] = None,
+    quality: str = "auto",
+    mask_format: str = "png",
+    mask_only: bool = False,
+    transport: str = "json",
+    background: Optional[str] = None,
+    background_image: Optional[UploadFile] = File(None),
+    profile: bool = False
 ):
-    remover = get_remover()
-    try:
-        # Single file
-        if len(files) == 1:
-            file = files[0]
-            contents = await file.read()
-            image = Image.open(io.BytesIO(contents))
-            filename = file.filename
-            
-            logger.info(f"Processing single file: {filename}")
-
-            if return_mask:
-                result_image, mask_image = remover.remove_background(image, return_mask=True)
-            else:
-                result_image = remover.remove_background(image, return_mask=False)
-
-            output = io.BytesIO()
-
-            if output_format.lower() == "png":
-                result_image.save(output, format="PNG")
-                media_type = "image/png"
-            elif output_format.lower() in ["jpg", "jpeg"]:
-                bg = Image.new("RGB", result_image.size, (255, 255, 255))
-                bg.paste(result_image, mask=result_image.split()[3])
-                bg.save(output, format="JPEG")
-                media_type = "image/jpeg"
-            else:
-                raise HTTPException(status_code=400, detail="Unsupported output format")
+    # Without an explicit output_format, pick one from the Accept header (PNG by default)
+    negotiated = output_format is None
+    if negotiated:
+        output_format = negotiate_format(request.headers.get("accept"))
+    options = validate_options(output_format, quality, return_mask, mask_format, mask_only, transport, background)
 
-            output.seek(0)
+    # Batch processing (ZIP), streamed while the images are processed
+    if len(files) > 1:
+        logger.info(f"Processing batch of {len(files)} files")
+        require_ready()
+        if background_image is not None:
+            options = await with_background_image(options, (await ingest_files([background_image]))[0])
+        uploads = await ingest_files(files)
 
-            if return_mask:
-                result_b64 = base64.b64encode(output.getvalue()).decode()
+        # stream_zip releases this slot once the archive is complete
+        if not get_executor().try_acquire():
+            for upload in uploads:
+                upload.close()
+            raise server_busy()
+        return StreamingResponse(
+            stream_zip(uploads, options, quality),
+            media_type="application/zip",
+            headers={"Content-Disposition": f"attachment; filename=processed_images.zip"}
+        )
 
-                mask_output = io.BytesIO()
-                mask_image.save(mask_output, format="PNG")
-                mask_output.seek(0)
-                mask_b64 = base64.b64encode(mask_output.getvalue()).decode()
-
-                return JSONResponse({
-                    "result": result_b64,
-                    "mask": mask_b64,
-                    "format": output_format,
-                    "filename": filename
-                })
+    # Single file
+    with admit_request():
+        try:
+            if background_image is not None:
+                options = await with_background_image(options, (await ingest_files([background_image]))[0])
+            if wants_profile(request, profile):
+                # Starlette has already spooled the upload; ingesting it is part of the profile
+                filename = files[0].filename or "image"
+                encoded, headers = await process_profiled(
+                    functools.partial(ingest_file, files[0].file, filename), options, quality
+                )
             else:
-                return Response(content=output.getvalue(), media_type=media_type)
-        
-        # Batch processing (ZIP)
-        else:
-            logger.info(f"Processing batch of {len(files)} files")
-            zip_output = io.BytesIO()
-            with zipfile.ZipFile(zip_output, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                for file in files:
-                    contents = await file.read()
-                    image = Image.open(io.BytesIO(contents))
-                    filename = file.filename
-                    base_name = os.path.splitext(filename)[0]
-
-                    if return_mask:
-                        result_image, mask_image = remover.remove_background(image, return_mask=True)
-                    else:
-                        result_image = remover.remove_background(image, return_mask=False)
-
-                    # Save result image
-                    img_output = io.BytesIO()
-                    if output_format.lower() == "png":
-                        result_image.save(img_output, format="PNG")
-                        ext = "png"
-                    elif output_format.lower() in ["jpg", "jpeg"]:
-                        bg = Image.new("RGB", result_image.size, (255, 255, 255))
-                        bg.paste(result_image, mask=result_image.split()[3])
-                        bg.save(img_output, format="JPEG")
-                        ext = "jpg"
-                    else:
-                        continue 
-                    
-                    zip_file.writestr(f"no_bg_{base_name}.{ext}", img_output.getvalue())
-
-                    if return_mask:
-                        mask_output = io.BytesIO()
-                        mask_image.save(mask_output, format="PNG")
-                        zip_file.writestr(f"mask_{base_name}.png", mask_output.getvalue())
-            
-            zip_output.seek(0)
-            return Response(
-                content=zip_output.getvalue(),
-                media_type="application/zip",
-                headers={"Content-Disposition": f"attachment; filename=processed_images.zip"}
-            )
+                upload = (await ingest_files(files))[0]
+                filename = upload.filename
 
-    except Exception as e:
-        logger.error(f"Error processing upload: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+                logger.info(f"Processing single file: {filename} ({upload.width}x{upload.height} {upload.format})")
+
+                encoded, headers = await process_single(upload, options, quality)
+            if negotiated:
+                headers["Vary"] = "Accept"
+            return single_response(encoded, options, transport, filename, headers)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing upload: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
 
 from pydantic import BaseModel
 
@@ -145,56 +625,255 @@ class Base64Request(BaseModel):
     image_base64: str
     return_mask: bool = False
     output_format: str = "png"
+    quality: str = "auto"
+    mask_format: str = "png"
+    mask_only: bool = False
+    transport: str = "json"
+    background: Optional[str] = None
+    background_image_base64: Optional[str] = None
 
 @router.post("/remove-bg-base64")
-async def remove_background_base64(req: Base64Request):
-    image_base64 = req.image_base64
-    return_mask = req.return_mask
-    output_format = req.output_format
-    remover = get_remover()
-    try:
-        # Check if base64 string has header, e.g. "data:image/png;base64,..."
-        if "," in image_base64:
-            image_base64 = image_base64.split(",")[1]
-            
-        image_data = base64.b64decode(image_base64)
-        image = Image.open(io.BytesIO(image_data))
-        
-        logger.info("Processing base64 image")
-
-        if return_mask:
-            result_image, mask_image = remover.remove_background(image, return_mask=True)
-        else:
-            result_image = remover.remove_background(image, return_mask=False)
+async def remove_background_base64(req: Base64Request, request: Request, profile: bool = False):
+    quality = req.quality
+    options = validate_options(
+        req.output_format, quality, req.return_mask, req.mask_format, req.mask_only, req.transport, req.background
+    )
 
-        output = io.BytesIO()
+    with admit_request():
+        try:
+            # Decoding and spooling megabytes of base64 must not block the event loop
+            executor = get_executor()
+            try:
+                if req.background_image_base64:
+                    background_upload = await executor.run(ingest_base64, req.background_image_base64)
+                    options = await with_background_image(options, background_upload)
+                upload = None
+                if not wants_profile(request, profile):
+                    upload = await executor.run(ingest_base64, req.image_base64)
+            except UploadRejected as e:
+                raise rejection(e)
 
-        if output_format.lower() == "png":
-            result_image.save(output, format="PNG")
-        elif output_format.lower() in ["jpg", "jpeg"]:
-            bg = Image.new("RGB", result_image.size, (255, 255, 255))
-            bg.paste(result_image, mask=result_image.split()[3])
-            bg.save(output, format="JPEG")
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported output format")
+            if upload is None:
+                encoded, headers = await process_profiled(functools.partial(ingest_base64, req.image_base64), options, quality)
+            else:
+                logger.info(f"Processing base64 image ({upload.width}x{upload.height} {upload.format})")
 
-        output.seek(0)
-        result_b64 = base64.b64encode(output.getvalue()).decode()
+                encoded, headers = await process_single(upload, options, quality)
+            binary = binary_response(encoded, options, req.transport, "image", headers)
+            if binary is not None:
+                return binary
 
-        response = {
-            "result": result_b64,
-            "format": output_format
-        }
+            response = {
+                "result": base64.b64encode(encoded.result).decode(),
+                "format": options.output_format
+            }
 
-        if return_mask:
-            mask_output = io.BytesIO()
-            mask_image.save(mask_output, format="PNG")
-            mask_output.seek(0)
-            mask_b64 = base64.b64encode(mask_output.getvalue()).decode()
-            response["mask"] = mask_b64
+            if options.return_mask:
+                response["mask"] = json_mask(encoded, options)
+                response["mask_format"] = options.mask_format
 
-        return JSONResponse(response)
+            return JSONResponse(response, headers=headers)
 
-    except Exception as e:
-        logger.error(f"Error processing base64 image: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing base64 image: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+
+@router.post("/remove-bg-binary")
+async def remove_background_binary(
+    request: Request,
+    return_mask: bool = False,
+    output_format: Optional[str] = None,
+    quality: str = "auto",
+    mask_format: str = "png",
+    mask_only: bool = False,
+    transport: str = "json",
+    background: Optional[str] = None,
+    filename: Optional[str] = None,
+    profile: bool = False
+):
+    """Raw image bytes as the request body (application/octet-stream), spooled while they arrive"""
+    negotiated = output_format is None
+    if negotiated:
+        output_format = negotiate_format(request.headers.get("accept"))
+    options = validate_options(output_format, quality, return_mask, mask_format, mask_only, transport, background)
+
+    with admit_request():
+        try:
+            if wants_profile(request, profile):
+                # Receive the whole body first, so the profile covers ingestion but not the network
+                body = await request.body()
+                encoded, headers = await process_profiled(functools.partial(ingest_bytes, body, filename), options, quality)
+            else:
+                upload = await ingest_stream(request, filename)
+                logger.info(f"Processing binary upload ({upload.width}x{upload.height} {upload.format})")
+
+                encoded, headers = await process_single(upload, options, quality)
+            if negotiated:
+                headers["Vary"] = "Accept"
+            return single_response(encoded, options, transport, filename or "image", headers)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing binary upload: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+
+@router.post("/remove-bg-base64/stream")
+async def remove_background_base64_stream(
+    request: Request,
+    return_mask: bool = False,
+    output_format: str = "png",
+    quality: str = "auto",
+    mask_format: str = "png",
+    mask_only: bool = False,
+    transport: str = "json",
+    background: Optional[str] = None,
+    profile: bool = False
+):
+    """Base64 text (or a data URL) as the request body, decoded chunk by chunk while it arrives.
+
+    Answers like /remove-bg-base64, with the JSON written out piece by piece.
+    """
+    options = validate_options(output_format, quality, return_mask, mask_format, mask_only, transport, background)
+
+    with admit_request():
+        try:
+            if wants_profile(request, profile):
+                # Receive the whole body first, so the profile covers decoding but not the network
+                body = await request.body()
+                encoded, headers = await process_profiled(
+                    functools.partial(ingest_bytes, body, decoder=Base64Decoder()), options, quality
+                )
+            else:
+                upload = await ingest_stream(request, decoder=Base64Decoder())
+                logger.info(f"Processing streamed base64 image ({upload.width}x{upload.height} {upload.format})")
+
+                encoded, headers = await process_single(upload, options, quality)
+            binary = binary_response(encoded, options, transport, "image", headers)
+            if binary is not None:
+                return binary
+
+            fields = {"result": encoded.result, "format": options.output_format}
+            if options.return_mask:
+                fields["mask"] = json.loads(encoded.mask) if options.mask_format == "rle" else encoded.mask
+                fields["mask_format"] = options.mask_format
+            return StreamingResponse(base64_json_stream(fields), media_type="application/json", headers=headers)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing streamed base64 image: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
+
+def job_status(job: dict) -> dict:
+    """Public view of a job row"""
+    counts = {status: sum(item["status"] == status for item in job["items"]) for status in (QUEUED, DONE, FAILED)}
+    status = {
+        "id": job["id"],
+        "status": job["status"],
+        "total": len(job["items"]),
+        "done": counts[DONE],
+        "failed": counts[FAILED],
+        "pending": counts[QUEUED],
+        "created": job["created"],
+        "updated": job["updated"],
+        "error": job["error"],
+        "items": [
+            {"index": item["idx"], "filename": item["filename"], "status": item["status"], "error": item["error"]}
+            for item in job["items"]
+        ],
+        "results_url": f"/jobs/{job['id']}/results",
+    }
+    if job["status"] in (DONE, FAILED):
+        status["expires"] = job["updated"] + settings.JOB_TTL_HOURS * 3600
+    return status
+
+def get_job(job_id: str) -> dict:
+    job = get_job_runner().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def job_zip(store: JobStore, job: dict):
+    """ZIP of a job's finished results, one entry at a time"""
+    job_dir = store.job_dir(job["id"])
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, "w") as zip_file:
+        for item in job["items"]:
+            base_name = os.path.splitext(item["filename"])[0]
+            if item["status"] == FAILED:
+                zip_file.writestr(f"error_{base_name}.txt", f"Processing error: {item['error']}")
+            for prefix, name in (("no_bg", item["result_file"]), ("mask", item["mask_file"])):
+                if name is not None:
+                    extension = name.rsplit(".", 1)[-1]
+                    zip_file.writestr(_zip_entry(f"{prefix}_{base_name}.{extension}"), (job_dir / name).read_bytes())
+            yield stream.drain()
+    yield stream.drain()
+
+@router.post("/jobs", status_code=202)
+async def create_job(
+    files: List[UploadFile] = File(...),
+    return_mask: bool = False,
+    output_format: str = "png",
+    quality: str = "auto",
+    mask_format: str = "png",
+    mask_only: bool = False,
+    background: Optional[str] = None
+):
+    """Queue images for background processing, answers right away with the job id"""
+    runner = get_job_runner()
+    options = validate_options(output_format, quality, return_mask, mask_format, mask_only, "json", background)
+    uploads = await ingest_files(files)
+    try:
+        job_id = await get_executor().run(
+            runner.store.create, [(upload.filename, upload.open()) for upload in uploads], options_to_json(options, quality)
+        )
+    finally:
+        for upload in uploads:
+            upload.close()
+    runner.submit(job_id)
+    logger.info(f"Queued job {job_id} with {len(uploads)} images")
+    return JSONResponse(job_status(runner.store.get(job_id)), status_code=202, headers={"Location": f"/jobs/{job_id}"})
+
+@router.get("/jobs/{job_id}")
+async def job_status_endpoint(job_id: str):
+    """Progress of a job and the state of each image"""
+    return job_status(get_job(job_id))
+
+@router.get("/jobs/{job_id}/results")
+async def job_results(job_id: str):
+    """Every finished result of a job (and its mask) as a ZIP; failed images appear as error_*.txt"""
+    job = get_job(job_id)
+    return StreamingResponse(
+        job_zip(get_job_runner().store, job),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=job_{job_id}.zip"}
+    )
+
+@router.get("/jobs/{job_id}/results/{index}")
+async def job_result(job_id: str, index: int, mask: bool = False):
+    """One result (or with mask=true its mask)"""
+    job = get_job(job_id)
+    if not 0 <= index < len(job["items"]):
+        raise HTTPException(status_code=404, detail="No such image in this job")
+    item = job["items"][index]
+    name = item["mask_file"] if mask else item["result_file"]
+    if name is None:
+        if item["status"] == QUEUED:
+            raise HTTPException(status_code=409, detail="Image not processed yet")
+        raise HTTPException(status_code=404, detail=item["error"] or "No such output for this image")
+    options = json.loads(job["options"])
+    if mask:
+        media_type = MASK_FORMATS[options["mask_format"]][0]
+    else:
+        media_type = OUTPUT_FORMATS[options["output_format"]][1]
+    return FileResponse(get_job_runner().store.job_dir(job_id) / name, media_type=media_type)
+
+@router.delete("/jobs/{job_id}", status_code=204)
+async def delete_job(job_id: str):
+    """Delete a job and its files"""
+    get_job(job_id)
+    await get_executor().run(get_job_runner().store.delete, job_id)
+    return Response(status_code=204)
@@ -0,0 +1,146 @@
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import torch
+
+from app.core.compile import CompiledEngine
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def masks_from_output(preds) -> torch.Tensor:
+    """Turn raw model output into sigmoid masks of shape (B, H, W)"""
+    # Handle output types to match space app usage: preds[-1]
+    if isinstance(preds, (list, tuple)):
+        # Official space uses the LAST element [-1]
+        preds = preds[-1]
+    elif hasattr(preds, 'logits'):
+        preds = preds.logits
+
+    # Apply sigmoid (in fp32, the model may have produced bf16)
+    preds = preds.float().sigmoid()
+
+    # Drop the channel dimension: (B, 1, H, W) -> (B, H, W)
+    return preds.reshape(preds.shape[0], *preds.shape[-2:])
+
+
+class InferenceBackend:
+    """Forward pass between preprocessing and postprocessing.
+
+    ``forward`` takes a normalized (B, 3, H, W) float tensor and returns
+    sigmoid masks of shape (B, H, W) on ``self.device``. ``input_sizes``
+    lists the square input sizes it can run, None when any size works.
+    """
+
+    name = "base"
+    device = torch.device("cpu")
+    precision = "fp32"
+    model = None
+    input_sizes: Optional[List[int]] = None
+
+    def forward(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        raise NotImplementedError
+
+
+class TorchBackend(InferenceBackend):
+    """Eager PyTorch model, with optional precision mode and compiled engine"""
+
+    name = "torch"
+
+    def __init__(self, model: torch.nn.Module, device: torch.device, weights_path: Optional[Path] = None,
+                 precision: Optional[str] = None):
+        self.model = model
+        self.device = device
+        self.precision = self._apply_precision((precision or settings.PRECISION).lower())
+        self.engine = None
+        if settings.COMPILE_MODE.lower() != "off" and weights_path is not None:
+            self.engine = CompiledEngine(self.model, weights_path, self.device, precision=self.precision)
+
+    def _apply_precision(self, precision: str) -> str:
+        """Prepare the model for the requested precision mode, returns the active mode"""
+        if precision == "int8":
+            if self.device.type != "cpu":
+                logger.warning(f"int8 dynamic quantization is CPU only, using fp32 on {self.device}")
+                return "fp32"
+            # Quantizes every nn.Linear, which covers the backbone's attention and MLP layers
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            logger.info("Applied dynamic int8 quantization")
+        elif precision == "bf16":
+            logger.info(f"Using bf16 autocast on {self.device}")
+        elif precision != "fp32":
+            raise ValueError(f"Unknown precision mode: {precision}")
+        return precision
+
+    def _run_model(self, input_tensor: torch.Tensor):
+        """Forward pass through the compiled engine when one exists for this shape"""
+        with torch.autocast(self.device.type, dtype=torch.bfloat16, enabled=self.precision == "bf16"):
+            engine = self.engine.get(input_tensor) if self.engine is not None else None
+            if engine is not None:
+                try:
+                    return engine(input_tensor)
+                except Exception as e:
+                    self.engine.disable(input_tensor, e)
+            return self.model(input_tensor)
+
+    def forward(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return masks_from_output(self._run_model(input_tensor))
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime sessions over the graphs exported by export_onnx.py.
+
+    Each exported graph already ends in the sigmoid of the last BiRefNet
+    output, has a dynamic batch dimension and a fixed input size, so there is
+    one graph (``model_<size>.onnx``) per inference resolution. ``onnx_path``
+    is the directory holding them, or a single graph.
+    """
+
+    name = "onnx"
+
+    def __init__(self, onnx_path: Path, device: torch.device):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("The onnx backend needs onnxruntime: pip install onnxruntime")
+        onnx_path = Path(onnx_path)
+        graphs = sorted(onnx_path.glob("*.onnx")) if onnx_path.is_dir() else [onnx_path]
+        if not graphs or not graphs[0].exists():
+            raise RuntimeError(f"No ONNX model found at {onnx_path}, run export_onnx.py first")
+
+        providers = ["CPUExecutionProvider"]
+        if device.type == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        else:
+            device = torch.device("cpu")
+        self.device = device
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if settings.ONNX_INTRA_OP_THREADS > 0:
+            options.intra_op_num_threads = settings.ONNX_INTRA_OP_THREADS
+
+        # input size -> session; None for a graph with dynamic height and width
+        self.sessions = {}
+        for graph in graphs:
+            session = ort.InferenceSession(str(graph), sess_options=options, providers=providers)
+            height, width = session.get_inputs()[0].shape[2:]
+            size = height if isinstance(height, int) and height == width else None
+            self.sessions[size] = session
+        self.input_sizes = None if None in self.sessions else sorted(self.sessions)
+        logger.info(
+            f"ONNX Runtime sessions ready ({onnx_path}, sizes={self.input_sizes or 'any'}, "
+            f"providers={session.get_providers()})"
+        )
+
+    def forward(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        session = self.sessions.get(input_tensor.shape[-1], self.sessions.get(None))
+        if session is None:
+            raise ValueError(f"No ONNX graph for input size {input_tensor.shape[-1]} (have {self.input_sizes})")
+        inputs = np.ascontiguousarray(input_tensor.detach().cpu().numpy())
+        preds = session.run(None, {session.get_inputs()[0].name: inputs})[0]
+        masks = torch.from_numpy(preds)
+        return masks.reshape(masks.shape[0], *masks.shape[-2:])
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.core.encoding import EncodedResult
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+
+
+class ResultCache:
+    """Content-addressed cache of encoded results.
+
+    A bounded in-memory LRU tier sits in front of an optional on-disk tier;
+    both are limited by total bytes and evict the least recently used entries.
+    """
+
+    def __init__(self, memory_bytes: int, disk_dir: Optional[str] = None, disk_bytes: int = 0):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir and disk_bytes > 0 else None
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, EncodedResult]" = OrderedDict()
+        self._memory_used = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._scan_disk()
+
+    @classmethod
+    def from_settings(cls) -> Optional["ResultCache"]:
+        if not settings.CACHE_ENABLED:
+            return None
+        return cls(
+            memory_bytes=int(settings.CACHE_MEMORY_MB * 1024 * 1024),
+            disk_dir=settings.CACHE_DIR,
+            disk_bytes=int(settings.CACHE_DISK_MB * 1024 * 1024),
+        )
+
+    @staticmethod
+    def make_key(input_digest: str, **params) -> str:
+        """Combine the input's sha256 with every parameter that affects the output"""
+        digest = hashlib.sha256(input_digest.encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _entry_size(entry: EncodedResult) -> int:
+        return len(entry.result) + (len(entry.mask) if entry.mask else 0)
+
+    def get(self, key: str) -> Optional[EncodedResult]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry
+            on_disk = key in self._disk
+
+        entry = self._read_disk(key) if on_disk else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._disk.move_to_end(key)
+            self._put_memory(key, entry)
+        return entry
+
+    def put(self, key: str, entry: EncodedResult):
+        with self._lock:
+            self._put_memory(key, entry)
+        if self.disk_dir is not None:
+            self._write_disk(key, entry)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_used,
+            }
+
+    def _put_memory(self, key: str, entry: EncodedResult):
+        size = self._entry_size(entry)
+        if size > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= self._entry_size(old)
+        self._memory[key] = entry
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= self._entry_size(evicted)
+
+    # --- Disk tier ---
+    # Entry layout: 4-byte header length, JSON header, result bytes, mask bytes
+
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.bin"
+
+    def _scan_disk(self):
+        entries = []
+        for path in self.disk_dir.glob("*/*.bin"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_used += size
+        logger.info(f"Result cache: {len(self._disk)} entries ({self._disk_used} bytes) on disk")
+
+    def _read_disk(self, key: str) -> Optional[EncodedResult]:
+        path = self._path(key)
+        try:
+            raw = path.read_bytes()
+            (header_len,) = _HEADER.unpack_from(raw)
+            header = json.loads(raw[_HEADER.size:_HEADER.size + header_len])
+            offset = _HEADER.size + header_len
+            result = raw[offset:offset + header["result"]]
+            offset += header["result"]
+            mask = raw[offset:offset + header["mask"]] if header["mask"] is not None else None
+            os.utime(path)
+            size = tuple(header["size"]) if header.get("size") else None
+            return EncodedResult(result, header["media_type"], header["extension"], mask, size=size)
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+            with self._lock:
+                self._disk_used -= self._disk.pop(key, 0)
+            return None
+
+    def _write_disk(self, key: str, entry: EncodedResult):
+        header = json.dumps({
+            "media_type": entry.media_type,
+            "extension": entry.extension,
+            "result": len(entry.result),
+            "mask": len(entry.mask) if entry.mask is not None else None,
+            "size": entry.size,
+        }).encode()
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(_HEADER.pack(len(header)))
+                f.write(header)
+                f.write(entry.result)
+                if entry.mask is not None:
+                    f.write(entry.mask)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {key}: {e}")
+            return
+
+        size = path.stat().st_size
+        evict = []
+        with self._lock:
+            self._disk_used += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+            while self._disk_used > self.disk_bytes and self._disk:
+                old_key, old_size = self._disk.popitem(last=False)
+                self._disk_used -= old_size
+                evict.append(old_key)
+        for old_key in evict:
+            try:
+                self._path(old_key).unlink()
+            except OSError:
+                pass
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import torch
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def weights_digest(weights_path: Path, cache_dir: Path) -> str:
+    """sha256 of the weights file, remembered per (path, size, mtime) to avoid rehashing"""
+    stat = weights_path.stat()
+    index_path = cache_dir / "weights_digests.json"
+    try:
+        index = json.loads(index_path.read_text())
+    except (OSError, ValueError):
+        index = {}
+
+    entry = f"{weights_path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+    if entry not in index:
+        digest = hashlib.sha256()
+        with open(weights_path, "rb") as f:
+            for chunk in iter(lambda: f.read(16 * 1024 * 1024), b""):
+                digest.update(chunk)
+        index[entry] = digest.hexdigest()
+        try:
+            index_path.write_text(json.dumps(index))
+        except OSError as e:
+            logger.warning(f"Could not save weights digest: {e}")
+    return index[entry]
+
+
+class CompiledEngine:
+    """Optional compiled forward pass with a persistent on-disk artifact cache.
+
+    ``trace``: TorchScript trace per input shape, frozen and saved as
+    ``<cache_dir>/<key>.pt``, where the key hashes the weights, torch version,
+    device, precision and shape. Later processes load the artifact instead of
+    tracing again.
+    ``inductor``: ``torch.compile``; its own graph cache is pointed at
+    ``<cache_dir>/inductor`` so compiled kernels survive restarts.
+
+    Any failure falls back to eager execution.
+    """
+
+    def __init__(self, model: torch.nn.Module, weights_path: Path, device: torch.device,
+                 mode: Optional[str] = None, precision: str = "fp32"):
+        self.model = model
+        self.device = device
+        self.precision = precision
+        self.mode = (mode or settings.COMPILE_MODE).lower()
+        self.cache_dir = Path(settings.COMPILE_CACHE_DIR).expanduser()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.weights_path = Path(weights_path)
+        self._weights_digest = None
+        self._engines: Dict[Tuple[int, ...], torch.nn.Module] = {}
+        self._failed = set()
+        self._inductor = None
+
+        if self.mode == "inductor":
+            os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(self.cache_dir / "inductor"))
+            try:
+                self._inductor = torch.compile(model, dynamic=False)
+            except Exception as e:
+                logger.warning(f"torch.compile unavailable, using eager mode: {e}")
+                self.mode = "off"
+
+    def artifact_key(self, shape: Tuple[int, ...]) -> str:
+        if self._weights_digest is None:
+            self._weights_digest = weights_digest(self.weights_path, self.cache_dir)
+        parts = [self._weights_digest, torch.__version__, str(self.device), self.precision, "x".join(map(str, shape))]
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()[:32]
+
+    def _build(self, example: torch.Tensor) -> torch.nn.Module:
+        shape = tuple(example.shape)
+        path = self.cache_dir / f"{self.artifact_key(shape)}.pt"
+        if path.exists():
+            logger.info(f"Loading compiled model for {shape} from {path}")
+            return torch.jit.load(str(path), map_location=self.device)
+
+        logger.info(f"Tracing model for input shape {shape}...")
+        with torch.no_grad():
+            traced = torch.jit.trace(self.model, example, strict=False, check_trace=False)
+            traced = torch.jit.freeze(traced.eval())
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        torch.jit.save(traced, str(tmp_path))
+        os.replace(tmp_path, path)
+        logger.info(f"Saved compiled model to {path}")
+        return traced
+
+    def get(self, example: torch.Tensor) -> Optional[torch.nn.Module]:
+        """Compiled module for this input shape, or None to run eager"""
+        if self.mode == "inductor":
+            return self._inductor
+        if self.mode != "trace":
+            return None
+
+        shape = tuple(example.shape)
+        if shape in self._engines:
+            return self._engines[shape]
+        if shape in self._failed or shape[0] not in settings.COMPILE_BATCH_SIZES:
+            return None
+        try:
+            engine = self._build(example)
+        except Exception as e:
+            logger.warning(f"Compiling for {shape} failed, using eager mode: {e}")
+            self._failed.add(shape)
+            return None
+        self._engines[shape] = engine
+        return engine
+
+    def disable(self, example: torch.Tensor, error: Exception):
+        """Drop a compiled module that failed at run time"""
+        logger.warning(f"Compiled model failed for {tuple(example.shape)}, falling back to eager: {error}")
+        if self.mode == "inductor":
+            self.mode = "off"
+        else:
+            self._engines.pop(tuple(example.shape), None)
+            self._failed.add(tuple(example.shape))
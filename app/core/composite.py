@@ -0,0 +1,102 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageColor, ImageOps
+
+# Rows blended per step; keeps the uint16 temporaries small enough to stay in cache
+CHUNK_ROWS = 64
+
+
+class Background:
+    """What a cutout is composited onto: a solid color, a two-color gradient or an image.
+
+    ``str(background)`` is a stable description, used in cache keys.
+    """
+
+    def __init__(self, kind: str, colors: Sequence[Tuple[int, int, int]] = (), image: Optional[Image.Image] = None,
+                 horizontal: bool = False, spec: str = ""):
+        self.kind = kind
+        self.colors = [np.array(color, dtype=np.uint16) for color in colors]
+        self.image = image
+        self.horizontal = horizontal
+        self.spec = spec
+
+    @classmethod
+    def parse(cls, spec: str) -> Optional["Background"]:
+        """Parse a color ("white", "#f0f0f0", "rgb(0,0,0)") or "gradient:<color>:<color>[:horizontal]".
+
+        Returns None for "" and "transparent"; raises ValueError for anything else it does not understand.
+        """
+        spec = spec.strip().lower()
+        if spec in ("", "none", "transparent"):
+            return None
+        if spec.startswith("gradient:"):
+            parts = spec.split(":")[1:]
+            horizontal = parts[-1] == "horizontal"
+            if parts[-1] in ("horizontal", "vertical"):
+                parts = parts[:-1]
+            if len(parts) != 2:
+                raise ValueError(f"Gradient needs two colors: {spec}")
+            return cls("gradient", [_color(part) for part in parts], horizontal=horizontal, spec=spec)
+        return cls("color", [_color(spec)], spec=spec)
+
+    @classmethod
+    def from_image(cls, image: Image.Image, digest: str) -> "Background":
+        """Background image, scaled and center-cropped to cover each result"""
+        return cls("image", image=image if image.mode == "RGB" else image.convert("RGB"), spec=f"image:{digest}")
+
+    def __str__(self) -> str:
+        return self.spec
+
+    def fit(self, width: int, height: int) -> np.ndarray:
+        """Background for a width x height result, shaped (height, 1 or width, 3) so rows can be sliced.
+
+        Image backgrounds are scaled and cropped here, once per result: the
+        Background is shared by every image of a request, whatever their sizes.
+        """
+        if self.kind == "color":
+            return np.broadcast_to(self.colors[0], (height, 1, 3))
+        if self.kind == "gradient":
+            start, end = self.colors
+            if self.horizontal:
+                t = np.linspace(0.0, 1.0, width, dtype=np.float32)[None, :, None]
+            else:
+                t = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None, None]
+            gradient = (start + (end.astype(np.float32) - start) * t + 0.5).astype(np.uint16)
+            return np.broadcast_to(gradient, (height, gradient.shape[1], 3))
+        return np.asarray(ImageOps.fit(self.image, (width, height), Image.Resampling.BILINEAR))
+
+
+WHITE = Background("color", [(255, 255, 255)], spec="white")
+
+
+def _color(value: str) -> Tuple[int, int, int]:
+    try:
+        return ImageColor.getrgb(value)[:3]
+    except ValueError:
+        raise ValueError(f"Unsupported color: {value}")
+
+
+def composite(image: Image.Image, mask: Image.Image, background: Background) -> Image.Image:
+    """Blend image onto background with the uint8 mask as alpha, returns an RGB image.
+
+    Works directly from the RGB pixels and the mask, in integer arithmetic
+    (rounded division by 255), a band of rows at a time.
+    """
+    rgb = np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+    alpha = np.asarray(mask)
+    height, width = alpha.shape
+    out = np.empty((height, width, 3), dtype=np.uint8)
+    fitted = background.fit(width, height)
+    for top in range(0, height, CHUNK_ROWS):
+        bottom = min(height, top + CHUNK_ROWS)
+        a = alpha[top:bottom, :, None].astype(np.uint16)
+        # fg * a + bg * (255 - a) <= 255 * 255, so every step fits in uint16
+        blend = rgb[top:bottom].astype(np.uint16)
+        blend *= a
+        blend += (255 - a) * fitted[top:bottom]
+        blend += 128
+        blend += blend >> 8
+        blend >>= 8
+        out[top:bottom] = blend
+    return Image.frombuffer("RGB", image.size, out, "raw", "RGB", 0, 1)
@@ -7,4 +7,94 @@ class Settings:
     MODEL_ID: str = "briaai/RMBG-2.0"
     DEVICE: str = "cuda" if torch.cuda.is_available() else ("mps" if torch.backends.mps.is_available() else "cpu")
 
+    # Micro-batching: concurrent requests are grouped into one forward pass.
+    # BATCH_MAX_SIZE also caps every batched forward pass to bound peak memory.
+    BATCHING_ENABLED: bool = os.getenv("RMBG_BATCHING_ENABLED", "1") == "1"
+    BATCH_MAX_SIZE: int = int(os.getenv("RMBG_BATCH_MAX_SIZE", "8"))
+    BATCH_MAX_WAIT_MS: float = float(os.getenv("RMBG_BATCH_MAX_WAIT_MS", "10"))
+
+    # Upsample and quantize masks on the inference device (only uint8 is copied back)
+    POSTPROCESS_ON_DEVICE: bool = os.getenv("RMBG_POSTPROCESS_ON_DEVICE", "1") == "1"
+
+    # Result cache keyed by input bytes + request parameters
+    CACHE_ENABLED: bool = os.getenv("RMBG_CACHE_ENABLED", "1") == "1"
+    CACHE_MEMORY_MB: float = float(os.getenv("RMBG_CACHE_MEMORY_MB", "256"))
+    CACHE_DIR: str = os.getenv("RMBG_CACHE_DIR", "")
+    CACHE_DISK_MB: float = float(os.getenv("RMBG_CACHE_DISK_MB", "2048"))
+
+    # Blocking work runs on WORKER_THREADS threads; at most WORKER_THREADS + MAX_QUEUE
+    # requests are admitted, the rest get 503 with Retry-After
+    WORKER_THREADS: int = int(os.getenv("RMBG_WORKER_THREADS", str(min(4, os.cpu_count() or 1))))
+    MAX_QUEUE: int = int(os.getenv("RMBG_MAX_QUEUE", "32"))
+    RETRY_AFTER_SECONDS: int = int(os.getenv("RMBG_RETRY_AFTER_SECONDS", "1"))
+
+    # "thread": one process, batched inference; "process": WORKER_PROCESSES forked
+    # CPU workers sharing one copy of the weights (0 = one per core)
+    SERVING_MODE: str = os.getenv("RMBG_SERVING_MODE", "thread")
+    WORKER_PROCESSES: int = int(os.getenv("RMBG_WORKER_PROCESSES", "0"))
+
+    # Upload ingestion limits
+    MAX_UPLOAD_MB: float = float(os.getenv("RMBG_MAX_UPLOAD_MB", "50"))
+    MAX_INFLIGHT_UPLOAD_MB: float = float(os.getenv("RMBG_MAX_INFLIGHT_UPLOAD_MB", "1024"))
+    MAX_IMAGE_PIXELS: int = int(os.getenv("RMBG_MAX_IMAGE_PIXELS", str(64 * 1024 * 1024)))
+    UPLOAD_SPOOL_MB: float = float(os.getenv("RMBG_UPLOAD_SPOOL_MB", "8"))
+
+    # Dummy inferences run at startup before /ready reports ready
+    WARMUP_RUNS: int = int(os.getenv("RMBG_WARMUP_RUNS", "2"))
+    # Warm every inference size at batch 1 and BATCH_MAX_SIZE; off warms batch 1 at the largest size only
+    WARMUP_FULL: bool = os.getenv("RMBG_WARMUP_FULL", "1") == "1"
+
+    # Compiled engine: "off", "trace" (TorchScript, cached on disk) or "inductor" (torch.compile)
+    COMPILE_MODE: str = os.getenv("RMBG_COMPILE_MODE", "off")
+    COMPILE_CACHE_DIR: str = os.getenv("RMBG_COMPILE_CACHE_DIR", "~/.cache/rmbg/compiled")
+    COMPILE_BATCH_SIZES: tuple = tuple(int(b) for b in os.getenv("RMBG_COMPILE_BATCH_SIZES", "1").split(","))
+
+    # Inference precision: "fp32", "bf16" (autocast) or "int8" (dynamic quantization, CPU only)
+    PRECISION: str = os.getenv("RMBG_PRECISION", "fp32")
+
+    # Inference backend: "torch" or "onnx" (ONNX Runtime, graph from export_onnx.py)
+    BACKEND: str = os.getenv("RMBG_BACKEND", "torch")
+    ONNX_MODEL_PATH: str = os.getenv("RMBG_ONNX_MODEL_PATH", "")
+    ONNX_INTRA_OP_THREADS: int = int(os.getenv("RMBG_ONNX_INTRA_OP_THREADS", "0"))
+
+    # Inference resolutions; "auto" quality picks the smallest one covering the image
+    # and steps down one size when the request queue is RESOLUTION_LOAD_THRESHOLD full
+    INFERENCE_SIZES: tuple = tuple(int(s) for s in os.getenv("RMBG_INFERENCE_SIZES", "512,768,1024").split(","))
+    DEFAULT_QUALITY: str = os.getenv("RMBG_DEFAULT_QUALITY", "auto")
+    RESOLUTION_LOAD_THRESHOLD: float = float(os.getenv("RMBG_RESOLUTION_LOAD_THRESHOLD", "0.75"))
+
+    # Coarse-to-fine refinement: large images get a second pass on full-resolution
+    # tiles along the uncertain mask boundary (REFINE_BAND, in 0-255 mask values)
+    REFINE_ENABLED: bool = os.getenv("RMBG_REFINE_ENABLED", "0") == "1"
+    REFINE_MIN_MEGAPIXELS: float = float(os.getenv("RMBG_REFINE_MIN_MEGAPIXELS", "8"))
+    REFINE_TILE_SIZE: int = int(os.getenv("RMBG_REFINE_TILE_SIZE", "1024"))
+    REFINE_TILE_OVERLAP: int = int(os.getenv("RMBG_REFINE_TILE_OVERLAP", "128"))
+    REFINE_BAND: tuple = (16, 240)
+
+    # Output encoders. PNG_STRATEGY is the zlib strategy: default, filtered, huffman, rle or fixed;
+    # WEBP_METHOD and AVIF_SPEED trade encode time for size (0 = slowest/smallest for WebP, 10 = fastest for AVIF)
+    PNG_COMPRESS_LEVEL: int = int(os.getenv("RMBG_PNG_COMPRESS_LEVEL", "6"))
+    PNG_STRATEGY: str = os.getenv("RMBG_PNG_STRATEGY", "default")
+    WEBP_QUALITY: int = int(os.getenv("RMBG_WEBP_QUALITY", "80"))
+    WEBP_LOSSLESS_EFFORT: int = int(os.getenv("RMBG_WEBP_LOSSLESS_EFFORT", "50"))
+    WEBP_METHOD: int = int(os.getenv("RMBG_WEBP_METHOD", "4"))
+    AVIF_QUALITY: int = int(os.getenv("RMBG_AVIF_QUALITY", "70"))
+    AVIF_SPEED: int = int(os.getenv("RMBG_AVIF_SPEED", "8"))
+
+    # Asynchronous job API: state in JOBS_DIR/jobs.db, inputs and results next to it;
+    # finished jobs are deleted JOB_TTL_HOURS after their last update
+    JOBS_ENABLED: bool = os.getenv("RMBG_JOBS_ENABLED", "1") == "1"
+    JOBS_DIR: str = os.getenv("RMBG_JOBS_DIR", "~/.cache/rmbg/jobs")
+    JOB_WORKERS: int = int(os.getenv("RMBG_JOB_WORKERS", "1"))
+    JOB_TTL_HOURS: float = float(os.getenv("RMBG_JOB_TTL_HOURS", "24"))
+    JOB_CLEANUP_INTERVAL_SECONDS: float = float(os.getenv("RMBG_JOB_CLEANUP_INTERVAL_SECONDS", "600"))
+
+    # Opt-in per-request profiling (X-RMBG-Profile header or ?profile=true, with the
+    # X-Admin-Token header); artifacts are kept in PROFILE_DIR and served under
+    # /admin/profiles. Both are refused while ADMIN_TOKEN is empty
+    PROFILING_ENABLED: bool = os.getenv("RMBG_PROFILING_ENABLED", "0") == "1"
+    PROFILE_DIR: str = os.getenv("RMBG_PROFILE_DIR", "~/.cache/rmbg/profiles")
+    PROFILE_KEEP: int = int(os.getenv("RMBG_PROFILE_KEEP", "20"))
+    ADMIN_TOKEN: str = os.getenv("RMBG_ADMIN_TOKEN", "")
+
 settings = Settings()
@@ -0,0 +1,90 @@
+from typing import BinaryIO, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+from app.core import metrics
+
+_ORIENTATION = 0x0112
+# EXIF orientations that swap width and height
+_TRANSPOSED = (5, 6, 7, 8)
+
+
+class DecodedImage:
+    """An encoded image decoded in two steps, both with EXIF orientation applied.
+
+    ``preview(size)`` decodes just enough for the model: JPEGs are scaled in
+    the DCT domain by ``draft()``, other formats are decoded and shrunk with
+    ``reduce()``. ``full()`` decodes the full resolution on first use only, so
+    requests that never need the pixels at full size (e.g. mask-only) skip it.
+    ``size`` is the oriented full-resolution size and is known from the header.
+    """
+
+    def __init__(self, source: Union[str, BinaryIO]):
+        self.source = source
+        with self._open() as image:
+            self.format = image.format
+            self.orientation = image.getexif().get(_ORIENTATION, 1)
+            width, height = image.size
+        self.size: Tuple[int, int] = (height, width) if self.orientation in _TRANSPOSED else (width, height)
+        self._full: Optional[Image.Image] = None
+        self._preview: Optional[Tuple[int, Image.Image]] = None
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    def _open(self) -> Image.Image:
+        if hasattr(self.source, "seek"):
+            self.source.seek(0)
+        return Image.open(self.source)
+
+    def _orient(self, image: Image.Image) -> Image.Image:
+        # exif_transpose copies even when there is nothing to do
+        if self.orientation in (None, 1):
+            return image
+        return ImageOps.exif_transpose(image)
+
+    def preview(self, size: int) -> Image.Image:
+        """The image decoded at no less than size x size (or its full size, if smaller)"""
+        if self._preview is not None and self._preview[0] == size:
+            return self._preview[1]
+        with metrics.stage("decode"):
+            if self._full is not None:
+                image = self._full
+            elif self.format in ("JPEG", "MPO"):
+                image = self._open()
+                image.draft("RGB", (size, size))
+                image.load()
+                image = self._orient(image)
+            else:
+                # No cheaper partial decode; keep the full image for full()
+                image = self._open()
+                image.load()
+                image = self._full = self._orient(image)
+            factor = min(image.width // size, image.height // size)
+            if factor >= 2:
+                image = image.reduce(factor)
+        self._preview = (size, image)
+        return image
+
+    def full(self) -> Image.Image:
+        """The full-resolution image, decoded on first call"""
+        if self._full is None:
+            with metrics.stage("decode"):
+                image = self._open()
+                image.load()
+                self._full = self._orient(image)
+        return self._full
+
+
+def model_input(image: Union[Image.Image, DecodedImage], size: int) -> Image.Image:
+    """What to preprocess for a size x size model input"""
+    return image.preview(size) if isinstance(image, DecodedImage) else image
+
+
+def full_image(image: Union[Image.Image, DecodedImage]) -> Image.Image:
+    return image.full() if isinstance(image, DecodedImage) else image
@@ -0,0 +1,248 @@
+import base64
+import io
+import json
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+from app.core import metrics
+from app.core.composite import WHITE, Background, composite
+from app.core.config import settings
+
+# output_format -> (Pillow format, media type, file extension)
+OUTPUT_FORMATS = {
+    "png": ("PNG", "image/png", "png"),
+    "jpg": ("JPEG", "image/jpeg", "jpg"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+    "webp": ("WEBP", "image/webp", "webp"),
+    "webp_lossless": ("WEBP", "image/webp", "webp"),
+    "avif": ("AVIF", "image/avif", "avif"),
+}
+
+# mask_format -> (media type, file extension)
+MASK_FORMATS = {
+    "png": ("image/png", "png"),      # 8-bit single channel
+    "png1": ("image/png", "png"),     # 1-bit, thresholded at 128
+    "rle": ("application/json", "json"),  # COCO-style uncompressed RLE of the thresholded mask
+    "raw": ("application/octet-stream", "raw"),  # row-major uint8, shape reported separately
+}
+
+# Response transports for result + mask
+TRANSPORTS = ("json", "multipart")
+
+_BINARY_LUT = [0] * 128 + [255] * 128
+
+# zlib strategies accepted by RMBG_PNG_STRATEGY (Pillow's compress_type)
+PNG_STRATEGIES = {
+    "default": 0,
+    "filtered": 1,
+    "huffman": 2,
+    "rle": 3,
+    "fixed": 4,
+}
+
+# Formats picked from the Accept header, in order of preference on equal q
+NEGOTIATED_FORMATS = ("webp", "avif", "png", "jpeg")
+
+
+def _avif_supported() -> bool:
+    try:
+        # Older Pillow releases get AVIF from the plugin package
+        import pillow_avif  # noqa: F401
+    except ImportError:
+        pass
+    Image.init()
+    return "AVIF" in Image.SAVE
+
+
+AVIF_SUPPORTED = _avif_supported()
+
+
+class EncodedResult(NamedTuple):
+    """Encoded output of one processed image"""
+    result: bytes
+    media_type: str
+    extension: str
+    mask: Optional[bytes] = None
+    # Time spent encoding, None when the result came from the cache
+    encode_seconds: Optional[float] = None
+    # (width, height) of the result and mask
+    size: Optional[Tuple[int, int]] = None
+
+
+class OutputOptions(NamedTuple):
+    """What a request wants encoded"""
+    output_format: str = "png"
+    return_mask: bool = False
+    mask_format: str = "png"
+    # Skip the result image, only the mask is encoded
+    mask_only: bool = False
+    # Composite onto this instead of returning a transparent cutout
+    background: Optional[Background] = None
+
+
+def check_output_format(output_format: str) -> str:
+    """Normalize output_format, raising ValueError if it is not supported"""
+    output_format = output_format.lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    if output_format == "avif" and not AVIF_SUPPORTED:
+        raise ValueError("AVIF output is not supported by this Pillow build")
+    return output_format
+
+
+def check_mask_format(mask_format: str) -> str:
+    """Normalize mask_format, raising ValueError if it is not supported"""
+    mask_format = mask_format.lower()
+    if mask_format not in MASK_FORMATS:
+        raise ValueError(f"Unsupported mask format: {mask_format}")
+    return mask_format
+
+
+def negotiate_format(accept: Optional[str], default: str = "png") -> str:
+    """Pick an output format from an Accept header.
+
+    Only image types listed explicitly count; wildcards (``*/*``, ``image/*``)
+    keep the default, so existing clients still get PNG.
+    """
+    if not accept:
+        return default
+    ranges = {}
+    for part in accept.split(","):
+        media_type, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges[media_type.strip().lower()] = q
+
+    best, best_q = default, 0.0
+    for output_format in NEGOTIATED_FORMATS:
+        if output_format == "avif" and not AVIF_SUPPORTED:
+            continue
+        q = ranges.get(OUTPUT_FORMATS[output_format][1], 0.0)
+        if q > best_q:
+            best, best_q = output_format, q
+    return best
+
+
+def encoder_options(output_format: str) -> Dict[str, Any]:
+    """Pillow save() options for an output format, from the settings"""
+    output_format = check_output_format(output_format)
+    if output_format == "png":
+        return {"compress_level": settings.PNG_COMPRESS_LEVEL, "compress_type": PNG_STRATEGIES[settings.PNG_STRATEGY.lower()]}
+    if output_format == "webp":
+        return {"quality": settings.WEBP_QUALITY, "method": settings.WEBP_METHOD}
+    if output_format == "webp_lossless":
+        # In lossless mode quality is the compression effort
+        return {"lossless": True, "quality": settings.WEBP_LOSSLESS_EFFORT, "method": settings.WEBP_METHOD}
+    if output_format == "avif":
+        return {"quality": settings.AVIF_QUALITY, "speed": settings.AVIF_SPEED}
+    return {}
+
+
+def encode_image(result_image: Image.Image, output_format: str) -> Tuple[bytes, str, str]:
+    """Encode an RGBA result, returns (bytes, media type, extension)"""
+    pil_format, media_type, extension = OUTPUT_FORMATS[check_output_format(output_format)]
+    output = io.BytesIO()
+    if pil_format == "JPEG":
+        # Results for JPEG are normally composited already (see OutputOptions.background)
+        if result_image.mode == "RGBA":
+            result_image = composite(result_image, result_image.getchannel("A"), WHITE)
+        result_image.save(output, format="JPEG")
+    else:
+        result_image.save(output, format=pil_format, **encoder_options(output_format))
+    return output.getvalue(), media_type, extension
+
+
+def mask_rle(mask: np.ndarray) -> Dict[str, Any]:
+    """COCO-style uncompressed RLE of a uint8 mask thresholded at 128.
+
+    Runs are counted in column-major order and start with background, so a
+    mask that begins with foreground has a leading zero.
+    """
+    height, width = mask.shape
+    flat = (mask >= 128).ravel(order="F")
+    if flat.size == 0:
+        return {"size": [height, width], "counts": []}
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate(([0], changes, [flat.size]))
+    counts = np.diff(bounds).tolist()
+    if flat[0]:
+        counts.insert(0, 0)
+    return {"size": [height, width], "counts": counts}
+
+
+def encode_mask(mask_image: Image.Image, mask_format: str = "png") -> bytes:
+    """Encode a mask in one of MASK_FORMATS"""
+    mask_format = check_mask_format(mask_format)
+    if mask_format == "raw":
+        return mask_image.tobytes()
+    if mask_format == "rle":
+        return json.dumps(mask_rle(np.asarray(mask_image)), separators=(",", ":")).encode()
+    if mask_format == "png1":
+        mask_image = mask_image.point(_BINARY_LUT, "1")
+    output = io.BytesIO()
+    mask_image.save(output, format="PNG", **encoder_options("png"))
+    return output.getvalue()
+
+
+def encode_result(result_image: Optional[Image.Image], output_format: str, mask_image: Optional[Image.Image] = None,
+                  mask_format: str = "png", mask_only: bool = False) -> EncodedResult:
+    """Encode a result image and, if given, its mask; with mask_only the result image is skipped"""
+    start = time.perf_counter()
+    if mask_only:
+        _, media_type, extension = OUTPUT_FORMATS[check_output_format(output_format)]
+        data = b""
+    else:
+        data, media_type, extension = encode_image(result_image, output_format)
+    mask = encode_mask(mask_image, mask_format) if mask_image is not None else None
+    elapsed = time.perf_counter() - start
+    metrics.STAGE_SECONDS.observe(elapsed, "encode")
+    size = (mask_image if mask_image is not None else result_image).size
+    return EncodedResult(data, media_type, extension, mask, elapsed, size)
+
+
+def encode_multipart(parts: List[Tuple[str, str, str, bytes]]) -> Tuple[bytes, str]:
+    """Build a multipart/mixed body from (name, filename, media type, data) parts.
+
+    Returns (body, Content-Type header value).
+    """
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for name, filename, media_type, data in parts:
+        chunks.append(
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Disposition: inline; name=\"{name}\"; filename=\"{filename}\"\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode()
+        )
+        chunks.append(data)
+        chunks.append(b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode())
+    return b"".join(chunks), f"multipart/mixed; boundary={boundary}"
+
+
+def base64_json_stream(fields: Dict[str, Any], chunk_size: int = 192 * 1024) -> Iterator[bytes]:
+    """Serialize a flat JSON object piece by piece, writing bytes values as base64 strings.
+
+    Binary payloads are encoded chunk_size bytes (a multiple of 3) at a time,
+    so the full base64 text never exists in memory.
+    """
+    yield b"{"
+    for i, (name, value) in enumerate(fields.items()):
+        yield (b"," if i else b"") + json.dumps(name).encode() + b":"
+        if isinstance(value, bytes):
+            yield b'"'
+            for start in range(0, len(value), chunk_size):
+                yield base64.b64encode(value[start:start + chunk_size])
+            yield b'"'
+        else:
+            yield json.dumps(value).encode()
+    yield b"}"
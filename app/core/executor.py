@@ -0,0 +1,57 @@
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceExecutor:
+    """Runs blocking decode/inference/encode work off the event loop.
+
+    ``max_workers`` threads do the work; at most ``max_workers + max_queue``
+    requests are admitted at a time: ``try_acquire`` refuses anything beyond
+    that instead of letting it pile up.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.max_workers = max(1, max_workers or settings.WORKER_THREADS)
+        self.max_queue = max(0, settings.MAX_QUEUE if max_queue is None else max_queue)
+        self.capacity = self.max_workers + self.max_queue
+
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rmbg-worker")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        logger.info(f"Inference executor started (workers={self.max_workers}, queue={self.max_queue})")
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def try_acquire(self) -> bool:
+        """Reserve a request slot, returns False when the service is full"""
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Run fn(*args, **kwargs) on the worker pool from synchronous code"""
+        return self._pool.submit(fn, *args, **kwargs)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the worker pool and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
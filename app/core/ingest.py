@@ -0,0 +1,253 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import tempfile
+import threading
+from typing import AsyncIterable, BinaryIO, Optional
+
+from PIL import Image
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+
+# Let Pillow refuse decompression bombs as well (it raises above 2x this limit)
+Image.MAX_IMAGE_PIXELS = settings.MAX_IMAGE_PIXELS
+
+
+class UploadRejected(ValueError):
+    """Raised when an upload is refused; status_code is the HTTP status to return"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadBudget:
+    """Caps the total bytes of uploads held by all requests at once"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, n: int, held: int = 0, name: str = "image"):
+        """Reserve n more bytes for an upload that already holds held bytes.
+
+        An upload that can never fit is refused with 413, one that only has to
+        wait for other uploads to finish with 503.
+        """
+        with self._lock:
+            if held + n > self.max_bytes:
+                raise UploadRejected(
+                    f"{name}: upload exceeds the {self.max_bytes / (1024 * 1024):g} MB in-flight upload limit",
+                    status_code=413
+                )
+            if self.used + n > self.max_bytes:
+                raise UploadRejected(f"{name}: too many uploads in flight, please retry later", status_code=503)
+            self.used += n
+
+    def release(self, n: int):
+        with self._lock:
+            self.used -= n
+
+
+upload_budget = UploadBudget(int(settings.MAX_INFLIGHT_UPLOAD_MB * 1024 * 1024))
+
+
+class Upload:
+    """An ingested image: spooled to disk when large, hashed, and header-checked.
+
+    Holds its bytes against the global upload budget until ``close()``.
+    """
+
+    def __init__(self, filename: Optional[str]):
+        self.filename = filename or "image"
+        self.file = tempfile.SpooledTemporaryFile(max_size=int(settings.UPLOAD_SPOOL_MB * 1024 * 1024))
+        self.size = 0
+        self.digest = ""
+        self.format = None
+        self.width = 0
+        self.height = 0
+        self._hash = hashlib.sha256()
+        self._closed = False
+
+    def write(self, chunk: bytes):
+        if self.size + len(chunk) > settings.MAX_UPLOAD_MB * 1024 * 1024:
+            raise UploadRejected(f"{self.filename}: upload exceeds {settings.MAX_UPLOAD_MB} MB", status_code=413)
+        upload_budget.reserve(len(chunk), self.size, self.filename)
+        self.size += len(chunk)
+        self._hash.update(chunk)
+        self.file.write(chunk)
+
+    def finish(self):
+        """Seal the upload and check its image header before anything is decoded"""
+        self.digest = self._hash.hexdigest()
+        self.format, self.width, self.height = probe_image(self.open(), self.filename)
+        return self
+
+    def open(self) -> BinaryIO:
+        self.file.seek(0)
+        return self.file
+
+    def read(self) -> bytes:
+        return self.open().read()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.file.close()
+            upload_budget.release(self.size)
+
+
+def probe_image(fp: BinaryIO, filename: str = "image"):
+    """Read only the image header and validate its dimensions.
+
+    Any format Pillow can open is accepted (e.g. MPO, which many cameras write
+    for ordinary JPEGs); only oversized inputs and decompression bombs are refused.
+    """
+    try:
+        with Image.open(fp) as image:
+            image_format, (width, height) = image.format, image.size
+    except Image.DecompressionBombError as e:
+        raise UploadRejected(f"{filename}: {e}", status_code=413)
+    except Image.UnidentifiedImageError:
+        # Pillow's message holds the repr of the (temporary) file object
+        raise UploadRejected(f"{filename}: not a valid image (unrecognized format)", status_code=400)
+    except Exception as e:
+        raise UploadRejected(f"{filename}: not a valid image ({e})", status_code=400)
+
+    if width * height > settings.MAX_IMAGE_PIXELS:
+        raise UploadRejected(
+            f"{filename}: {width}x{height} exceeds the {settings.MAX_IMAGE_PIXELS} pixel limit", status_code=413
+        )
+    return image_format, width, height
+
+
+async def read_upload(file, filename: Optional[str] = None) -> Upload:
+    """Ingest an async readable (e.g. UploadFile) chunk by chunk.
+
+    Hashing, spooling (possibly to disk) and the header probe run on a thread,
+    not on the event loop.
+    """
+    upload = Upload(filename or getattr(file, "filename", None))
+    try:
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            await asyncio.to_thread(upload.write, chunk)
+        return await asyncio.to_thread(upload.finish)
+    except Exception:
+        upload.close()
+        raise
+
+
+class Base64Decoder:
+    """Incremental base64 decoder for bodies that arrive in arbitrary chunks.
+
+    Decodes every complete 4-character group as soon as it is available, so
+    only a few bytes are held back between chunks. Whitespace and a leading
+    data URL prefix ("data:image/png;base64,") are skipped.
+    """
+
+    _PREFIX = b"data:"
+    _WHITESPACE = b" \t\r\n"
+
+    def __init__(self):
+        self._pending = b""
+        self._in_header = True
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = self._pending + chunk.translate(None, self._WHITESPACE)
+        if self._in_header:
+            if len(data) < len(self._PREFIX) and self._PREFIX.startswith(data):
+                self._pending = data
+                return b""
+            if data.startswith(self._PREFIX):
+                comma = data.find(b",")
+                if comma == -1:
+                    if len(data) > 256:
+                        raise UploadRejected("Malformed data URL")
+                    self._pending = data
+                    return b""
+                data = data[comma + 1:]
+            self._in_header = False
+
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        try:
+            return base64.b64decode(data[:usable], validate=True)
+        except binascii.Error as e:
+            raise UploadRejected(f"Invalid base64 data: {e}")
+
+    def finish(self):
+        if self._pending:
+            raise UploadRejected("Invalid base64 data: truncated input")
+
+
+async def read_stream(chunks: AsyncIterable[bytes], filename: Optional[str] = None,
+                      decoder: Optional[Base64Decoder] = None) -> Upload:
+    """Ingest a request body while it arrives (e.g. ``request.stream()``), optionally base64 decoding it.
+
+    Like read_upload, every chunk is decoded and written on a thread.
+    """
+    upload = Upload(filename)
+
+    def consume(chunk: bytes):
+        if decoder is not None:
+            chunk = decoder.feed(chunk)
+        if chunk:
+            upload.write(chunk)
+
+    try:
+        async for chunk in chunks:
+            await asyncio.to_thread(consume, chunk)
+        if decoder is not None:
+            decoder.finish()
+        if upload.size == 0:
+            raise UploadRejected("Empty request body")
+        return await asyncio.to_thread(upload.finish)
+    except Exception:
+        upload.close()
+        raise
+
+
+def ingest_file(fp: BinaryIO, filename: Optional[str] = None, decoder: Optional[Base64Decoder] = None) -> Upload:
+    """Ingest a file object chunk by chunk, optionally base64 decoding it (blocking, call it off the event loop)"""
+    upload = Upload(filename)
+    try:
+        while True:
+            chunk = fp.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if decoder is not None:
+                chunk = decoder.feed(chunk)
+            if chunk:
+                upload.write(chunk)
+        if decoder is not None:
+            decoder.finish()
+        return upload.finish()
+    except Exception:
+        upload.close()
+        raise
+
+
+def ingest_bytes(data: bytes, filename: Optional[str] = None, decoder: Optional[Base64Decoder] = None) -> Upload:
+    """Ingest an image that is already in memory, optionally base64 decoding it (blocking, call it off the event loop)"""
+    return ingest_file(io.BytesIO(data), filename, decoder)
+
+
+def ingest_base64(text: str, filename: Optional[str] = None) -> Upload:
+    """Ingest a base64 string or data URL (blocking, call it off the event loop)"""
+    # Strip a data URL header, e.g. "data:image/png;base64,..."
+    try:
+        data = base64.b64decode(text.split(",")[-1])
+    except binascii.Error as e:
+        raise UploadRejected(f"Invalid base64 data: {e}")
+    return ingest_bytes(data, filename)
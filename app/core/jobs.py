@@ -0,0 +1,317 @@
+import json
+import logging
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional, Tuple
+
+from app.core.composite import Background
+from app.core.config import settings
+from app.core.decode import DecodedImage
+from app.core.encoding import MASK_FORMATS, OutputOptions, encode_result
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    options TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result_file TEXT,
+    mask_file TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+# Job and item states
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def options_to_json(options: OutputOptions, quality: str) -> str:
+    fields = options._asdict()
+    fields["background"] = str(options.background) if options.background is not None else None
+    fields["quality"] = quality
+    return json.dumps(fields)
+
+
+def options_from_json(data: str) -> Tuple[OutputOptions, str]:
+    fields = json.loads(data)
+    quality = fields.pop("quality")
+    background = fields.pop("background")
+    return OutputOptions(**fields, background=Background.parse(background) if background else None), quality
+
+
+class JobStore:
+    """Job state in SQLite, inputs and outputs as files next to it.
+
+    Layout: ``<root>/jobs.db`` and one ``<root>/<job id>/`` directory per job
+    holding ``input_<n>`` and the encoded ``result_<n>.<ext>`` / ``mask_<n>.<ext>``.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root).expanduser()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.root / "jobs.db"), check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+
+    def job_dir(self, job_id: str) -> Path:
+        return self.root / job_id
+
+    def create(self, files: List[Tuple[str, BinaryIO]], options: str) -> str:
+        """Copy the inputs into a new job directory and queue the job, returns its id"""
+        job_id = uuid.uuid4().hex
+        job_dir = self.job_dir(job_id)
+        job_dir.mkdir()
+        for index, (_, fp) in enumerate(files):
+            with open(job_dir / f"input_{index}", "wb") as f:
+                shutil.copyfileobj(fp, f)
+
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT INTO jobs (id, status, created, updated, options) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, now, now, options)
+            )
+            self._db.executemany(
+                "INSERT INTO job_items (job_id, idx, filename, status) VALUES (?, ?, ?, ?)",
+                [(job_id, index, filename, QUEUED) for index, (filename, _) in enumerate(files)]
+            )
+            self._db.execute("COMMIT")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """The job row with its items, None if unknown"""
+        with self._lock:
+            job = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            items = self._db.execute("SELECT * FROM job_items WHERE job_id = ? ORDER BY idx", (job_id,)).fetchall()
+        job = dict(job)
+        job["items"] = [dict(item) for item in items]
+        return job
+
+    def unfinished(self) -> List[str]:
+        """Jobs that were queued or running, oldest first (e.g. when the service restarted)"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created", (QUEUED, RUNNING)
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?", (status, error, time.time(), job_id)
+            )
+
+    def finish_item(self, job_id: str, index: int, result_file: Optional[str] = None,
+                    mask_file: Optional[str] = None, error: Optional[str] = None):
+        status = FAILED if error is not None else DONE
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "UPDATE job_items SET status = ?, result_file = ?, mask_file = ?, error = ? WHERE job_id = ? AND idx = ?",
+                (status, result_file, mask_file, error, job_id, index)
+            )
+            self._db.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id))
+            self._db.execute("COMMIT")
+
+    def delete(self, job_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def delete_expired(self, ttl_seconds: float) -> int:
+        """Remove finished jobs not updated for ttl_seconds, returns how many"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) AND updated < ?", (DONE, FAILED, time.time() - ttl_seconds)
+            ).fetchall()
+        for row in rows:
+            self.delete(row["id"])
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class JobRunner:
+    """Background threads that work through queued jobs with a BackgroundRemover.
+
+    Items of a job run BATCH_MAX_SIZE at a time through
+    ``remove_background_batch``; each result is written and recorded as soon
+    as it is done, so a restarted service resumes with the remaining items.
+    Finished jobs are deleted JOB_TTL_HOURS after their last update.
+    """
+
+    def __init__(self, store: JobStore, get_remover: Callable, workers: Optional[int] = None):
+        self.store = store
+        self.get_remover = get_remover
+        self.workers = max(1, workers or settings.JOB_WORKERS)
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"rmbg-job-worker-{i}", daemon=True) for i in range(self.workers)
+        ]
+        self._threads.append(threading.Thread(target=self._cleanup, name="rmbg-job-cleanup", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+        resumed = self.store.unfinished()
+        for job_id in resumed:
+            self._queue.put(job_id)
+        logger.info(f"Job runner started (workers={self.workers}, resumed {len(resumed)} jobs)")
+
+    def submit(self, job_id: str):
+        self._queue.put(job_id)
+
+    def shutdown(self, wait: bool = True):
+        """Stop after the items in progress; unfinished jobs resume on the next start"""
+        self._stopped.set()
+        for _ in range(self.workers):
+            self._queue.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+            self.store.close()
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is _STOP:
+                break
+            try:
+                self._process(job_id)
+                if self._queue.empty():
+                    # Idle until the next job: free this thread's preprocessing buffers
+                    self.get_remover().release_buffers()
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+                self.store.set_status(job_id, FAILED, str(e))
+
+    def _process(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None or job["status"] not in (QUEUED, RUNNING):
+            return
+        self.store.set_status(job_id, RUNNING)
+        options, quality = options_from_json(job["options"])
+        remover = self.get_remover()
+        job_dir = self.store.job_dir(job_id)
+
+        pending = [item for item in job["items"] if item["status"] == QUEUED]
+        batch_size = max(1, settings.BATCH_MAX_SIZE)
+        for start in range(0, len(pending), batch_size):
+            if self._stopped.is_set():
+                return
+            self._process_items(remover, job_id, job_dir, pending[start:start + batch_size], options, quality)
+
+        items = self.store.get(job_id)["items"]
+        if all(item["status"] == FAILED for item in items):
+            self.store.set_status(job_id, FAILED, "All images failed")
+        else:
+            self.store.set_status(job_id, DONE)
+
+    def _process_items(self, remover, job_id: str, job_dir: Path, items: List[dict], options: OutputOptions, quality: str):
+        files, images, sizes, decoded = [], [], [], []
+        try:
+            for item in items:
+                fp = open(job_dir / f"input_{item['idx']}", "rb")
+                files.append(fp)
+                try:
+                    # Decode here, so a corrupt file fails its own item and not the whole batch
+                    image = DecodedImage(fp)
+                    size = remover.select_input_size(image.size, quality)
+                    image.preview(size)
+                except Exception as e:
+                    self.store.finish_item(job_id, item["idx"], error=f"Not a valid image: {e}")
+                    continue
+                images.append(image)
+                sizes.append(size)
+                decoded.append(item)
+            if not decoded:
+                return
+
+            try:
+                results = self._remove_background(remover, images, sizes, options)
+            except Exception as e:
+                if len(decoded) == 1:
+                    logger.error(f"Job {job_id}: inference failed: {e}", exc_info=True)
+                    self.store.finish_item(job_id, decoded[0]["idx"], error=str(e))
+                    return
+                # Find the failing image(s) by running the batch one image at a time
+                logger.warning(f"Job {job_id}: batch of {len(decoded)} failed ({e}), retrying one by one")
+                for item, image, size in zip(decoded, images, sizes):
+                    self._process_decoded(remover, job_id, job_dir, item, image, size, options)
+                return
+
+            for item, (result_image, mask_image) in zip(decoded, results):
+                try:
+                    self._write_result(job_id, job_dir, item["idx"], result_image, mask_image, options)
+                except Exception as e:
+                    self.store.finish_item(job_id, item["idx"], error=str(e))
+        finally:
+            for fp in files:
+                fp.close()
+
+    @staticmethod
+    def _remove_background(remover, images: List[DecodedImage], sizes: List[int], options: OutputOptions):
+        return remover.remove_background_batch(
+            images, return_mask=True, max_batch_size=len(images), input_size=sizes,
+            background=options.background, composite=not options.mask_only
+        )
+
+    def _process_decoded(self, remover, job_id: str, job_dir: Path, item: dict, image: DecodedImage, size: int,
+                         options: OutputOptions):
+        try:
+            (result_image, mask_image), = self._remove_background(remover, [image], [size], options)
+            self._write_result(job_id, job_dir, item["idx"], result_image, mask_image, options)
+        except Exception as e:
+            logger.error(f"Job {job_id}: image {item['idx']} failed: {e}", exc_info=True)
+            self.store.finish_item(job_id, item["idx"], error=str(e))
+
+    def _write_result(self, job_id: str, job_dir: Path, index: int, result_image, mask_image, options: OutputOptions):
+        encoded = encode_result(
+            result_image, options.output_format, mask_image if options.return_mask else None,
+            options.mask_format, options.mask_only
+        )
+        result_file = mask_file = None
+        if not options.mask_only:
+            result_file = f"result_{index}.{encoded.extension}"
+            (job_dir / result_file).write_bytes(encoded.result)
+        if encoded.mask is not None:
+            mask_file = f"mask_{index}.{MASK_FORMATS[options.mask_format][1]}"
+            (job_dir / mask_file).write_bytes(encoded.mask)
+        (job_dir / f"input_{index}").unlink(missing_ok=True)
+        self.store.finish_item(job_id, index, result_file, mask_file)
+
+    def _cleanup(self):
+        interval = max(1.0, settings.JOB_CLEANUP_INTERVAL_SECONDS)
+        while not self._stopped.wait(interval):
+            try:
+                removed = self.store.delete_expired(settings.JOB_TTL_HOURS * 3600)
+                if removed:
+                    logger.info(f"Removed {removed} expired jobs")
+            except Exception as e:
+                logger.warning(f"Job cleanup failed: {e}")
@@ -1,20 +1,22 @@
 import logging
+import time
 import torch
 import numpy as np
 from PIL import Image
 from pathlib import Path
-from torchvision import transforms
-from huggingface_hub import hf_hub_download
-from transformers import AutoConfig, AutoModelForImageSegmentation
-from safetensors.torch import load_file
-from typing import Tuple, Union, Optional
+from typing import List, Tuple, Union, Optional
 from app.core.config import settings
+from app.core.preprocess import Preprocessor
+from app.core.cache import ResultCache
+from app.core.refine import refine_mask, should_refine
+from app.core.backends import InferenceBackend, OnnxBackend, TorchBackend
+from app.core.composite import Background, composite
+from app.core.decode import DecodedImage, full_image, model_input
+from app.core import metrics
 
 logger = logging.getLogger(__name__)
 
 import sys
-import sys
-import os
 
 # Bundled model directory (for offline operation)
 if getattr(sys, 'frozen', False):
@@ -53,16 +55,126 @@ else:
     BASE_DIR = Path(__file__).parent.parent.parent
     BUNDLED_MODEL_DIR = BASE_DIR / "models" / "RMBG-2.0"
 
+QUALITY_LEVELS = ("auto", "fast", "balanced", "best")
+
+def peak_rss_mb() -> Optional[int]:
+    """Peak resident memory of this process in MB (None where unsupported)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes on Linux
+    return int(peak / (1024 * 1024 if sys.platform == "darwin" else 1024))
+
 class BackgroundRemover:
-    def __init__(self, progress_callback=None):
+    def __init__(self, progress_callback=None, backend: Optional[InferenceBackend] = None):
         self.device = torch.device(settings.DEVICE)
         logger.info(f"Using device: {self.device}")
         
         self.progress_callback = progress_callback
-        self.model = self._load_model()
+        self.load_stats = []
+        # A ready-made backend (e.g. a stub for benchmarks) skips model loading
+        self.backend = backend or self._create_backend(settings.BACKEND.lower())
+        # The ONNX backend may run elsewhere than settings.DEVICE (e.g. CPU only)
+        self.device = self.backend.device
+        # One preprocessor (with its own buffers) per inference resolution
+        self.input_sizes = self._usable_sizes(settings.INFERENCE_SIZES)
+        self.can_refine = self._supports_refinement()
+        self.preprocessors = {size: Preprocessor(self.device, (size, size)) for size in self.input_sizes}
+        self.preprocessor = self.preprocessors[self.input_sizes[-1]]
+
+    @property
+    def model(self):
+        """The torch model, None for non-torch backends"""
+        return self.backend.model
+
+    @property
+    def precision(self) -> str:
+        return self.backend.precision
+
+    def select_input_size(self, image_size: Tuple[int, int], quality: Optional[str] = None, load: float = 0.0) -> int:
+        """Pick the inference resolution for an image.
+
+        quality "fast" / "balanced" / "best" maps to the smallest / middle /
+        largest configured size. "auto" takes the smallest size that covers the
+        image's longest side, one size lower when the service is under load.
+        """
+        quality = (quality or settings.DEFAULT_QUALITY).lower()
+        sizes = self.input_sizes
+        if quality == "fast":
+            return sizes[0]
+        if quality == "balanced":
+            return sizes[len(sizes) // 2]
+        if quality == "best":
+            return sizes[-1]
+        if quality != "auto":
+            raise ValueError(f"Unknown quality: {quality}")
+
+        longest = max(image_size)
+        index = next((i for i, size in enumerate(sizes) if size >= longest), len(sizes) - 1)
+        if load >= settings.RESOLUTION_LOAD_THRESHOLD and index > 0:
+            index -= 1
+        return sizes[index]
+
+    def _usable_sizes(self, configured) -> List[int]:
+        """The configured inference sizes the backend can run (e.g. ONNX graphs have fixed sizes)"""
+        sizes = sorted(set(configured))
+        supported = self.backend.input_sizes
+        if supported is None:
+            return sizes
+        usable = [size for size in sizes if size in supported]
+        if not usable:
+            logger.warning(f"{self.backend.name} backend supports none of INFERENCE_SIZES {sizes}, using {supported}")
+            return sorted(supported)
+        if len(usable) < len(sizes):
+            logger.warning(f"{self.backend.name} backend only supports sizes {supported}, using {usable} of {sizes}")
+        return usable
+
+    def _supports_refinement(self) -> bool:
+        supported = self.backend.input_sizes
+        if settings.REFINE_ENABLED and supported is not None and settings.REFINE_TILE_SIZE not in supported:
+            logger.warning(f"Refinement disabled: the {self.backend.name} backend cannot run {settings.REFINE_TILE_SIZE} tiles")
+            return False
+        return True
+
+    def _create_backend(self, name: str) -> InferenceBackend:
+        if name == "onnx":
+            onnx_path = Path(settings.ONNX_MODEL_PATH) if settings.ONNX_MODEL_PATH else BUNDLED_MODEL_DIR / "onnx"
+            if self.progress_callback:
+                self.progress_callback(0.5, "Loading ONNX model...")
+            backend = OnnxBackend(onnx_path, self.device)
+            if self.progress_callback:
+                self.progress_callback(1.0, "Ready!")
+            return backend
+        if name != "torch":
+            raise ValueError(f"Unknown inference backend: {name}")
+        model = self._load_model()
+        return TorchBackend(model, self.device, self.weights_path)
         
+    def _report(self, progress: float, message: str):
+        """Report a loading step, with time and peak RSS of the step that just ended"""
+        now = time.perf_counter()
+        text = message
+        if self._phase is not None:
+            name, started = self._phase
+            stats = {"phase": name, "seconds": round(now - started, 3), "peak_rss_mb": peak_rss_mb()}
+            self.load_stats.append(stats)
+            logger.info(f"{name} took {stats['seconds']:.2f}s (peak RSS {stats['peak_rss_mb']} MB)")
+            text = f"{message} (last step {stats['seconds']:.1f}s, peak RSS {stats['peak_rss_mb']} MB)"
+        self._phase = (message, now)
+        if self.progress_callback:
+            self.progress_callback(progress, text)
+
     def _load_model(self):
+        # Imported here so the ONNX backend does not pay for transformers at all
+        from huggingface_hub import hf_hub_download
+        from transformers import AutoConfig, AutoModelForImageSegmentation
+        from safetensors.torch import load_file
+        from accelerate import init_empty_weights
+
         logger.info(f"Loading {settings.MODEL_ID} model...")
+        self._phase = None
         
         # Check if bundled model exists
         bundled_weights = BUNDLED_MODEL_DIR / "model.safetensors"
@@ -75,9 +187,7 @@ class BackgroundRemover:
         
         try:
             # Load configuration
-            if self.progress_callback:
-                msg = "Loading configuration..." if use_bundled else "Downloading configuration..."
-                self.progress_callback(0.1, msg)
+            self._report(0.1, "Loading configuration..." if use_bundled else "Downloading configuration...")
             
             if use_bundled:
                 config = AutoConfig.from_pretrained(
@@ -91,15 +201,13 @@ class BackgroundRemover:
                     trust_remote_code=True
                 )
             
-            # Create model architecture
-            if self.progress_callback:
-                self.progress_callback(0.3, "Creating model architecture...")
-            model = AutoModelForImageSegmentation.from_config(config, trust_remote_code=True)
+            # Create model architecture without allocating parameter storage
+            self._report(0.3, "Creating model architecture...")
+            with init_empty_weights():
+                model = AutoModelForImageSegmentation.from_config(config, trust_remote_code=True)
             
             # Load weights
-            if self.progress_callback:
-                msg = "Loading model weights..." if use_bundled else "Downloading model weights..."
-                self.progress_callback(0.5, msg)
+            self._report(0.5, "Loading model weights..." if use_bundled else "Downloading model weights...")
             
             if use_bundled:
                 model_path = bundled_weights
@@ -109,19 +217,22 @@ class BackgroundRemover:
                     filename="model.safetensors"
                 )
             
-            if self.progress_callback:
-                self.progress_callback(0.7, "Loading weights into model...")
-            state_dict = load_file(str(model_path))
-            model.load_state_dict(state_dict, strict=True)
+            # Read tensors straight onto the target device and let the model
+            # adopt them (assign=True) instead of copying into initialized params
+            self._report(0.7, "Loading weights into model...")
+            load_device = "cpu" if self.device.type == "cpu" else str(self.device)
+            self.weights_path = Path(model_path)
+            state_dict = load_file(str(model_path), device=load_device)
+            model.load_state_dict(state_dict, strict=True, assign=True)
+            del state_dict
             
-            # Transfer to device
-            if self.progress_callback:
-                self.progress_callback(0.9, "Transferring to device...")
+            # Non-persistent buffers are still on the CPU
+            self._report(0.9, "Transferring to device...")
             model.to(self.device)
             model.eval()
             
-            if self.progress_callback:
-                self.progress_callback(1.0, "Ready!")
+            self._report(1.0, "Ready!")
+            self._phase = None
             logger.info("Model loaded successfully!")
             return model
             
@@ -129,58 +240,165 @@ class BackgroundRemover:
             logger.error(f"Failed to load model: {e}")
             raise RuntimeError(f"Could not load RMBG-2.0 model: {e}")
 
+    def warmup(self, runs: Optional[int] = None, batch_sizes: Optional[List[int]] = None, full: Optional[bool] = None) -> float:
+        """Run dummy inferences so the first request does not pay kernel setup; returns seconds.
+
+        Buffers are allocated on the calling thread, so call it from the thread
+        that will serve the requests.
+        """
+        runs = settings.WARMUP_RUNS if runs is None else runs
+        full = settings.WARMUP_FULL if full is None else full
+        batch_sizes = batch_sizes or (sorted({1, settings.BATCH_MAX_SIZE}) if full else [1])
+        input_sizes = self.input_sizes if full else self.input_sizes[-1:]
+        start = time.perf_counter()
+        for input_size in input_sizes:
+            dummy = Image.new("RGB", (input_size, input_size))
+            for _ in range(runs):
+                for batch_size in batch_sizes:
+                    self.predict_masks([dummy] * batch_size, input_size)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Warmup finished: {runs} runs x batch sizes {batch_sizes} x sizes {input_sizes} in {elapsed:.2f}s")
+        return elapsed
+
+    def cache_key(self, input_digest: str, input_size: int, **params) -> str:
+        """Result cache key for the sha256 of the encoded input and the request parameters"""
+        return ResultCache.make_key(
+            input_digest, model=settings.MODEL_ID, backend=self.backend.name,
+            precision=self.precision, input_size=input_size, refine=settings.REFINE_ENABLED, **params
+        )
+
     def preprocess_image(self, image: Image.Image, input_size: Tuple[int, int] = (1024, 1024)) -> torch.Tensor:
         """Preprocess input image - Standard Resize"""
-        image = image.convert("RGB")
-        
-        transform = transforms.Compose([
-            transforms.Resize(input_size),
-            transforms.ToTensor(),
-            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-        ])
-        return transform(image).unsqueeze(0).to(self.device)
+        width, height = input_size
+        if width != height or width not in self.preprocessors:
+            return Preprocessor(self.device, input_size)([image])
+        return self.preprocess_batch([image], width)
+
+    def preprocess_batch(self, images: List[Image.Image], input_size: Optional[int] = None) -> torch.Tensor:
+        """Preprocess several images into one (B, 3, S, S) tensor at one of the configured sizes.
+
+        The returned tensor may share the preprocessor's reusable buffer, so it
+        is only valid until the next call from the same thread.
+        """
+        if not input_size:
+            return self.preprocessor(images)
+        if input_size not in self.preprocessors:
+            # e.g. refinement tiles at a size that is not an inference resolution
+            self.preprocessors[input_size] = Preprocessor(self.device, (input_size, input_size))
+        return self.preprocessors[input_size](images)
 
     def postprocess_mask(self, mask: torch.Tensor, original_size: Tuple[int, int]) -> Image.Image:
         """Postprocess predicted mask"""
-        # mask is tensor (1024, 1024) range 0-1
-        
-        # Use ToPILImage to handle 0-1 to 0-255 conversion correctly
-        pred_pil = transforms.ToPILImage()(mask)
-        
-        # Resize back to original size using BICUBIC for better edges
-        mask_image = pred_pil.resize(original_size, Image.BILINEAR)
-        return mask_image
-
-    def remove_background(self, image: Union[Image.Image, str], return_mask: bool = False) -> Union[Image.Image, Tuple[Image.Image, Image.Image]]:
-        """Remove background from image"""
-        if not isinstance(image, Image.Image):
-             image = Image.open(image)
-             
-        original_size = image.size # Width, Height
-        input_tensor = self.preprocess_image(image)
-
-        with torch.no_grad():
-            preds = self.model(input_tensor)
-        
-        # Handle output types to match space app usage: preds[-1]
-        if isinstance(preds, (list, tuple)):
-            # Official space uses the LAST element [-1]
-            preds = preds[-1]
-        elif hasattr(preds, 'logits'):
-            preds = preds.logits
-            
-        # Apply sigmoid
-        preds = preds.sigmoid().cpu()
-        
-        # Squeeze to get (H, W) or (C, H, W)
-        pred = preds[0].squeeze()
+        mask_array = self.mask_to_array(mask, original_size)
+        return Image.frombuffer("L", original_size, mask_array, "raw", "L", 0, 1)
 
-        # preds is the mask
-        mask_image = self.postprocess_mask(pred, original_size)
-        
-        result_image = image.convert("RGBA")
-        result_image.putalpha(mask_image)
+    def mask_to_array(self, mask: torch.Tensor, original_size: Tuple[int, int]) -> np.ndarray:
+        """Upsample a (H, W) 0-1 mask to original_size (width, height) as a uint8 array"""
+        if settings.POSTPROCESS_ON_DEVICE:
+            mask = mask.to(self.device)
+        else:
+            mask = mask.cpu()
+        width, height = original_size
+        mask = torch.nn.functional.interpolate(
+            mask[None, None].float(), size=(height, width), mode="bilinear", align_corners=False
+        )[0, 0]
+        # Quantize in place, only the uint8 result leaves the device
+        mask = mask.mul_(255).add_(0.5).clamp_(0, 255).to(torch.uint8)
+        return mask.cpu().numpy()
+
+    def _forward(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        """Run the backend and return sigmoid masks of shape (B, H, W) on the model device"""
+        return self.backend.forward(input_tensor)
+
+    def release_buffers(self):
+        """Free the calling thread's preprocessing buffers (e.g. before it goes idle)"""
+        for preprocessor in list(self.preprocessors.values()):
+            preprocessor.release()
+
+    def predict_mask_arrays(self, images: List[Union[Image.Image, DecodedImage]], input_size: Optional[int] = None) -> List[np.ndarray]:
+        """One stacked forward pass at one resolution, masks as uint8 arrays at each image's size"""
+        size = input_size or self.preprocessor.input_size[0]
+        inputs = [model_input(image, size) for image in images]
+        with metrics.stage("preprocess"):
+            input_tensor = self.preprocess_batch(inputs, input_size)
+        # On CUDA the forward pass is asynchronous, its tail is counted as postprocess
+        with metrics.stage("forward"):
+            preds = self._forward(input_tensor)
+        with metrics.stage("postprocess"):
+            return [self.mask_to_array(pred, image.size) for pred, image in zip(preds, images)]
+
+    def predict_masks(self, images: List[Union[Image.Image, DecodedImage]], input_size: Optional[int] = None) -> List[Image.Image]:
+        """Predict masks for several images with a single stacked forward pass at one resolution.
+
+        Large images get a tiled high-resolution pass along the mask boundary
+        when refinement is enabled.
+        """
+        masks = []
+        for image, mask_array in zip(images, self.predict_mask_arrays(images, input_size)):
+            if self.can_refine and should_refine(image.size):
+                mask_array = refine_mask(self, full_image(image), mask_array)
+            masks.append(Image.frombuffer("L", image.size, mask_array, "raw", "L", 0, 1))
+        return masks
+
+    def apply_mask(self, image: Union[Image.Image, DecodedImage], mask_image: Image.Image, background: Optional[Background] = None) -> Image.Image:
+        """Attach the predicted mask to the image as alpha channel, or blend onto background.
+
+        RGB and mask are stacked into one RGBA buffer that the returned image
+        wraps without copying, so it can go straight to the encoder. With a
+        background the result is an RGB image and no RGBA buffer is built.
+        """
+        image = full_image(image)
+        with metrics.stage("composite"):
+            if background is not None:
+                return composite(image, mask_image, background)
+            rgb = image if image.mode == "RGB" else image.convert("RGB")
+            rgba = np.empty((image.height, image.width, 4), dtype=np.uint8)
+            rgba[..., :3] = np.asarray(rgb)
+            rgba[..., 3] = np.asarray(mask_image)
+        return Image.frombuffer("RGBA", image.size, rgba, "raw", "RGBA", 0, 1)
+
+    def remove_background(self, image: Union[Image.Image, DecodedImage, str], return_mask: bool = False, input_size: Optional[int] = None, background: Optional[Background] = None, composite: bool = True) -> Union[Image.Image, Tuple[Image.Image, Image.Image]]:
+        """Remove background from image, optionally replacing it with background.
+
+        Paths are decoded at about the inference resolution first, the full
+        resolution only for the composite. With composite=False only the mask
+        is computed and the result image is None.
+        """
+        if not isinstance(image, (Image.Image, DecodedImage)):
+            image = DecodedImage(image)
+
+        mask_image = self.predict_masks([image], input_size or self.select_input_size(image.size))[0]
+        result_image = self.apply_mask(image, mask_image, background) if composite else None
 
         if return_mask:
             return result_image, mask_image
         return result_image
+
+    def remove_background_batch(self, images: List[Union[Image.Image, DecodedImage, str]], return_mask: bool = False, max_batch_size: Optional[int] = None, input_size: Union[int, List[int], None] = None, background: Union[Background, List[Optional[Background]], None] = None, composite: Union[bool, List[bool]] = True) -> List[Union[Image.Image, Tuple[Image.Image, Image.Image]]]:
+        """Remove background from several images, running at most max_batch_size per forward pass.
+
+        input_size is one resolution for all images, one per image, or None to
+        let select_input_size decide; images are grouped by resolution.
+        background and composite are likewise one for all images or one per image.
+        """
+        batch_size = max(1, max_batch_size or settings.BATCH_MAX_SIZE)
+        images = [image if isinstance(image, (Image.Image, DecodedImage)) else DecodedImage(image) for image in images]
+        if isinstance(input_size, int):
+            sizes = [input_size] * len(images)
+        elif input_size is None:
+            sizes = [self.select_input_size(image.size) for image in images]
+        else:
+            sizes = list(input_size)
+        backgrounds = list(background) if isinstance(background, list) else [background] * len(images)
+        composites = list(composite) if isinstance(composite, list) else [composite] * len(images)
+
+        results = [None] * len(images)
+        for size in sorted(set(sizes)):
+            indices = [i for i, s in enumerate(sizes) if s == size]
+            for start in range(0, len(indices), batch_size):
+                chunk = indices[start:start + batch_size]
+                masks = self.predict_masks([images[i] for i in chunk], size)
+                for i, mask_image in zip(chunk, masks):
+                    result_image = self.apply_mask(images[i], mask_image, backgrounds[i]) if composites[i] else None
+                    results[i] = (result_image, mask_image) if return_mask else result_image
+        return results
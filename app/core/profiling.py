@@ -0,0 +1,90 @@
+import cProfile
+import logging
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+import torch
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Artifact suffix -> media type
+ARTIFACTS = {
+    "trace.json": "application/json",
+    "pstats": "application/octet-stream",
+}
+
+_PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def profile_dir() -> Path:
+    path = Path(settings.PROFILE_DIR).expanduser()
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def profile_call(fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, str]:
+    """Run fn on the calling thread under torch.profiler and cProfile.
+
+    Writes a Chrome trace (``<id>.trace.json``) and a pstats dump
+    (``<id>.pstats``) to PROFILE_DIR, returns (fn's result, profile id).
+    """
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+    profile_id = uuid.uuid4().hex
+    start = time.perf_counter()
+    python_profiler = cProfile.Profile()
+    with torch.profiler.profile(activities=activities, record_shapes=True) as torch_profiler:
+        python_profiler.enable()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            python_profiler.disable()
+    elapsed = time.perf_counter() - start
+
+    directory = profile_dir()
+    torch_profiler.export_chrome_trace(str(directory / f"{profile_id}.trace.json"))
+    python_profiler.dump_stats(str(directory / f"{profile_id}.pstats"))
+    _prune(directory)
+    logger.info(f"Profiled request {profile_id} in {elapsed:.3f}s")
+    return result, profile_id
+
+
+def list_profiles() -> List[dict]:
+    """Saved profiles, newest first"""
+    directory = profile_dir()
+    profiles = []
+    for path in sorted(directory.glob("*.pstats"), key=lambda p: p.stat().st_mtime, reverse=True):
+        profile_id = path.name.split(".", 1)[0]
+        profiles.append({
+            "id": profile_id,
+            "created": path.stat().st_mtime,
+            "artifacts": [suffix for suffix in ARTIFACTS if (directory / f"{profile_id}.{suffix}").exists()],
+        })
+    return profiles
+
+
+def artifact_path(profile_id: str, suffix: str) -> Optional[Path]:
+    """Path of a saved artifact, None for unknown (or malformed) ids and suffixes"""
+    if suffix not in ARTIFACTS or not _PROFILE_ID.match(profile_id):
+        return None
+    path = profile_dir() / f"{profile_id}.{suffix}"
+    return path if path.exists() else None
+
+
+def _prune(directory: Path):
+    stale = sorted(directory.glob("*.pstats"), key=lambda p: p.stat().st_mtime, reverse=True)[max(1, settings.PROFILE_KEEP):]
+    for path in stale:
+        profile_id = path.name.split(".", 1)[0]
+        for suffix in ARTIFACTS:
+            try:
+                os.remove(directory / f"{profile_id}.{suffix}")
+            except FileNotFoundError:
+                pass
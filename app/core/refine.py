@@ -0,0 +1,86 @@
+import logging
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def should_refine(image_size: Tuple[int, int]) -> bool:
+    """Tiled refinement only pays off for images well above the model resolution"""
+    width, height = image_size
+    tile = settings.REFINE_TILE_SIZE
+    return (
+        settings.REFINE_ENABLED
+        and width * height >= settings.REFINE_MIN_MEGAPIXELS * 1_000_000
+        and width >= tile and height >= tile
+    )
+
+
+def _tile_starts(length: int, tile: int, stride: int) -> List[int]:
+    starts = list(range(0, length - tile + 1, stride))
+    if starts[-1] != length - tile:
+        starts.append(length - tile)
+    return starts
+
+
+def _feather(tile: int, overlap: int) -> np.ndarray:
+    """(tile, tile) blending weights that ramp down linearly across the overlap"""
+    ramp = np.ones(tile, dtype=np.float32)
+    if overlap > 0:
+        edge = np.linspace(1.0 / (overlap + 1), 1.0, overlap, dtype=np.float32)
+        ramp[:overlap] = edge
+        ramp[-overlap:] = edge[::-1]
+    return np.outer(ramp, ramp)
+
+
+def boundary_tiles(mask: np.ndarray, tile: int, overlap: int) -> Tuple[List[Tuple[int, int]], np.ndarray]:
+    """Tiles (x, y) that cover the uncertain boundary band of a full-size uint8 mask"""
+    low, high = settings.REFINE_BAND
+    band = (mask > low) & (mask < high)
+    stride = tile - overlap
+    tiles = [
+        (x, y)
+        for y in _tile_starts(mask.shape[0], tile, stride)
+        for x in _tile_starts(mask.shape[1], tile, stride)
+        if band[y:y + tile, x:x + tile].any()
+    ]
+    return tiles, band
+
+
+def refine_mask(remover, image: Image.Image, mask: np.ndarray) -> np.ndarray:
+    """Second, high-resolution pass over the boundary of a coarse mask.
+
+    The coarse mask (full size, uint8) marks an uncertain band where
+    REFINE_BAND[0] < mask < REFINE_BAND[1]. Only the full-resolution tiles
+    touching that band go through the model, in batches, so the cost grows
+    with the length of the object boundary instead of the image area. Tile
+    predictions are feather-blended and replace the coarse mask inside the band.
+    """
+    tile = settings.REFINE_TILE_SIZE
+    overlap = settings.REFINE_TILE_OVERLAP
+    tiles, band = boundary_tiles(mask, tile, overlap)
+    if not tiles:
+        return mask
+
+    rgb = image if image.mode == "RGB" else image.convert("RGB")
+    weights = _feather(tile, overlap)
+    accum = np.zeros(mask.shape, dtype=np.float32)
+    total = np.zeros(mask.shape, dtype=np.float32)
+
+    for start in range(0, len(tiles), settings.BATCH_MAX_SIZE):
+        chunk = tiles[start:start + settings.BATCH_MAX_SIZE]
+        crops = [rgb.crop((x, y, x + tile, y + tile)) for x, y in chunk]
+        preds = remover.predict_mask_arrays(crops, tile)
+        for (x, y), pred in zip(chunk, preds):
+            accum[y:y + tile, x:x + tile] += pred * weights
+            total[y:y + tile, x:x + tile] += weights
+
+    covered = band & (total > 0)
+    refined = mask.copy()
+    refined[covered] = np.clip(accum[covered] / total[covered] + 0.5, 0, 255).astype(np.uint8)
+    logger.info(f"Refined {image.width}x{image.height} mask with {len(tiles)} tiles")
+    return refined
@@ -0,0 +1,172 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+
+from PIL import Image
+
+from app.core.composite import Background
+from app.core.config import settings
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+# Seconds without requests after which the worker frees its preprocessing buffers
+_IDLE_SECONDS = 30.0
+
+
+class _Job:
+    __slots__ = ("image", "return_mask", "input_size", "background", "composite", "future", "queued_at")
+
+    def __init__(self, image: Image.Image, return_mask: bool, input_size: Optional[int], background: Optional[Background],
+                 composite: bool):
+        self.image = image
+        self.return_mask = return_mask
+        self.input_size = input_size
+        self.background = background
+        self.composite = composite
+        self.future = Future()
+        self.queued_at = time.perf_counter()
+
+
+class _Call:
+    __slots__ = ("fn", "future")
+
+    def __init__(self, fn: Callable):
+        self.fn = fn
+        self.future = Future()
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            self.future.set_result(self.fn())
+        except Exception as e:
+            self.future.set_exception(e)
+
+
+class BatchScheduler:
+    """Collects concurrent inference requests and runs them as stacked batches.
+
+    Requests are queued by ``submit``; a single worker thread waits for up to
+    ``max_batch_size`` images or ``max_wait_ms`` milliseconds after the first
+    one arrived, runs one forward pass and resolves each caller's future.
+    """
+
+    def __init__(self, remover, max_batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None):
+        self.remover = remover
+        self.max_batch_size = max(1, max_batch_size or settings.BATCH_MAX_SIZE)
+        wait_ms = settings.BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+        self.max_wait = max(0.0, wait_ms) / 1000.0
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="rmbg-batch-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(f"Batch scheduler started (max_batch_size={self.max_batch_size}, max_wait_ms={wait_ms})")
+
+    def submit(self, image: Image.Image, return_mask: bool = False, input_size: Optional[int] = None,
+               background: Optional[Background] = None, composite: bool = True) -> Future:
+        """Queue an image; the future resolves to what ``remove_background`` returns"""
+        job = _Job(image, return_mask, input_size, background, composite)
+        self._queue.put(job)
+        return job.future
+
+    def call(self, fn: Callable) -> Future:
+        """Run fn() on the worker thread between batches (e.g. the warmup, so its buffers are the ones requests use)"""
+        call = _Call(fn)
+        self._queue.put(call)
+        return call.future
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker thread after the queued jobs are processed"""
+        self._queue.put(_STOP)
+        if wait:
+            self._thread.join()
+
+    def _collect(self, first: _Job) -> Tuple[List[_Job], List[_Call], bool]:
+        batch = [first]
+        calls = []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is _STOP:
+                return batch, calls, True
+            if isinstance(job, _Call):
+                calls.append(job)
+            else:
+                batch.append(job)
+        return batch, calls, False
+
+    def _next(self):
+        try:
+            return self._queue.get(timeout=_IDLE_SECONDS)
+        except queue.Empty:
+            self.remover.release_buffers()
+            return self._queue.get()
+
+    def _run(self):
+        while True:
+            first = self._next()
+            if first is _STOP:
+                break
+            if isinstance(first, _Call):
+                first.run()
+                continue
+            batch, calls, stop = self._collect(first)
+            self._process(batch)
+            for call in calls:
+                call.run()
+            if stop:
+                break
+
+    def _process(self, batch: List[_Job]):
+        # Drop jobs whose callers went away before we started
+        batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.perf_counter()
+        for job in batch:
+            metrics.QUEUE_WAIT_SECONDS.observe(started - job.queued_at)
+        metrics.BATCH_SIZE.observe(len(batch))
+
+        try:
+            results = self._infer(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Inference failed: {e}", exc_info=True)
+                batch[0].future.set_exception(e)
+                return
+            # One bad image must not fail the other callers: retry them one at a time
+            logger.warning(f"Batched inference failed for {len(batch)} images ({e}), retrying one by one")
+            for job in batch:
+                try:
+                    (result,) = self._infer([job])
+                except Exception as e:
+                    logger.error(f"Inference failed: {e}", exc_info=True)
+                    job.future.set_exception(e)
+                else:
+                    self._resolve(job, result)
+            return
+
+        for job, result in zip(batch, results):
+            self._resolve(job, result)
+
+    def _infer(self, batch: List[_Job]) -> List[Tuple[Image.Image, Image.Image]]:
+        # Images with different resolutions run as separate forward passes
+        sizes = [job.input_size or self.remover.select_input_size(job.image.size) for job in batch]
+        return self.remover.remove_background_batch(
+            [job.image for job in batch], return_mask=True, max_batch_size=len(batch), input_size=sizes,
+            background=[job.background for job in batch], composite=[job.composite for job in batch]
+        )
+
+    @staticmethod
+    def _resolve(job: _Job, result: Tuple[Image.Image, Image.Image]):
+        result_image, mask_image = result
+        job.future.set_result((result_image, mask_image) if job.return_mask else result_image)
@@ -0,0 +1,87 @@
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+import torch
+
+from app.core.config import settings
+from app.core.decode import DecodedImage
+from app.core.encoding import EncodedResult, OutputOptions, encode_result
+
+logger = logging.getLogger(__name__)
+
+# Set in the parent right before forking; children inherit it (and its weights)
+_shared_remover = None
+
+
+def _init_worker(num_threads: int):
+    torch.set_num_threads(num_threads)
+    logger.info(f"Worker process {os.getpid()} ready ({num_threads} threads)")
+
+
+def _process_in_worker(contents: bytes, options: OutputOptions, input_size: Optional[int]) -> EncodedResult:
+    image = DecodedImage(io.BytesIO(contents))
+    result_image, mask_image = _shared_remover.remove_background(
+        image, return_mask=True, input_size=input_size, background=options.background, composite=not options.mask_only
+    )
+    if not options.return_mask:
+        mask_image = None
+    return encode_result(result_image, options.output_format, mask_image, options.mask_format, options.mask_only)
+
+
+def _warmup_in_worker() -> float:
+    return _shared_remover.warmup()
+
+
+class ProcessWorkerPool:
+    """Process pool where every worker uses the parent's single copy of the weights.
+
+    The model is loaded once in the parent, its tensors are moved to shared
+    memory and the workers are forked from it, so N workers add almost no
+    resident memory on top of one model. Only encoded bytes cross the process
+    boundary. Requires the ``fork`` start method (Linux).
+    """
+
+    def __init__(self, remover, processes: Optional[int] = None):
+        global _shared_remover
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("Process serving mode needs the 'fork' start method")
+        if remover.model is None:
+            # ONNX Runtime sessions do not survive a fork; use its own intra-op threads instead
+            raise RuntimeError(f"Process serving mode needs the torch backend, not {remover.backend.name}")
+
+        cpus = os.cpu_count() or 1
+        self.processes = max(1, processes or settings.WORKER_PROCESSES or cpus)
+        threads = max(1, cpus // self.processes)
+
+        try:
+            remover.model.share_memory()
+        except Exception as e:
+            # Forked children still share the weights copy-on-write
+            logger.warning(f"Could not move weights to shared memory: {e}")
+
+        _shared_remover = remover
+        self.remover = remover
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(threads,),
+        )
+        # The first submit forks every worker; do it before the parent starts other threads
+        self._pool.submit(os.getpid).result()
+        logger.info(f"Process worker pool started ({self.processes} processes x {threads} threads)")
+
+    def submit(self, contents: bytes, options: OutputOptions, input_size: Optional[int] = None) -> Future:
+        return self._pool.submit(_process_in_worker, contents, options, input_size)
+
+    def warmup(self):
+        """Send one warmup job per worker process"""
+        for future in [self._pool.submit(_warmup_in_worker) for _ in range(self.processes)]:
+            future.result()
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
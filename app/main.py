@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.api import endpoints
 from app.core import config
@@ -9,10 +10,30 @@ logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if config.settings.PROFILING_ENABLED and not config.settings.ADMIN_TOKEN:
+        logger.warning("RMBG_PROFILING_ENABLED is set without RMBG_ADMIN_TOKEN: profiling and /admin/* stay disabled")
+    if config.settings.SERVING_MODE == "process":
+        # Load the weights and fork the CPU workers before anything else starts threads
+        logger.info("Starting process worker pool...")
+        endpoints.get_worker_pool()
+    # Warm up in the background: /health answers right away, /ready once this is done
+    warmup = endpoints.start_warmup()
+    if config.settings.JOBS_ENABLED:
+        # Resume jobs left unfinished by the previous run
+        endpoints.get_job_runner()
+    yield
+    await warmup
+    endpoints.shutdown_services()
+
 app = FastAPI(
     title=config.settings.PROJECT_NAME,
     description="RMBG-2.0 Background Removal Service",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.include_router(endpoints.router)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark: eager vs compiled BackgroundRemover forward pass on CPU.
+
+Needs the model weights (run download_models.py first). The first compiled
+run traces and saves the artifact; run the script twice to see the cached
+start-up time.
+
+Usage: python3 -m bench.bench_compile [--mode trace] [--runs 5]
+"""
+
+import argparse
+import time
+import torch
+
+from app.core.config import settings
+
+
+def timed(fn, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", default="trace", choices=["trace", "inductor"])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    settings.DEVICE = "cpu"
+    settings.COMPILE_MODE = "off"
+    from app.core.model import BackgroundRemover
+    from app.core.compile import CompiledEngine
+
+    remover = BackgroundRemover()
+    example = torch.randn(1, 3, 1024, 1024)
+
+    with torch.no_grad():
+        remover.model(example)  # warm up
+        eager_ms = timed(lambda: remover.model(example), args.runs)
+
+        start = time.perf_counter()
+        engine = CompiledEngine(remover.model, remover.weights_path, remover.device, mode=args.mode)
+        compiled = engine.get(example)
+        compiled(example)  # first call includes compilation for inductor
+        startup_s = time.perf_counter() - start
+        compiled_ms = timed(lambda: compiled(example), args.runs)
+
+        diff = (remover.model(example)[-1] - compiled(example)[-1]).abs().max().item()
+
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} threads, {args.runs} runs")
+    print(f"  eager:            {eager_ms:8.1f} ms")
+    print(f"  {args.mode + ':':17} {compiled_ms:8.1f} ms  ({eager_ms / compiled_ms:.2f}x)")
+    print(f"  compile/load:     {startup_s:8.1f} s")
+    print(f"  max abs diff:     {diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: legacy torchvision preprocessing vs the cached Preprocessor.
+
+Usage: python3 -m bench.bench_preprocess [--size 4000x3000] [--runs 20]
+"""
+
+import argparse
+import time
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from app.core.preprocess import Preprocessor, IMAGENET_MEAN, IMAGENET_STD
+
+
+def legacy_preprocess(image: Image.Image, input_size=(1024, 1024)) -> torch.Tensor:
+    """The original BackgroundRemover.preprocess_image"""
+    image = image.convert("RGB")
+    transform = transforms.Compose([
+        transforms.Resize(input_size),
+        transforms.ToTensor(),
+        transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+    ])
+    return transform(image).unsqueeze(0)
+
+
+def timed(fn, runs: int) -> float:
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", default="4000x3000", help="Input image size WxH")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+    preprocessor = Preprocessor(torch.device("cpu"))
+
+    legacy_ms = timed(lambda: legacy_preprocess(image), args.runs)
+    cached_ms = timed(lambda: preprocessor([image]), args.runs)
+    diff = (legacy_preprocess(image) - preprocessor([image])).abs().max().item()
+
+    print(f"Input {width}x{height}, {args.runs} runs")
+    print(f"  legacy (torchvision): {legacy_ms:8.2f} ms")
+    print(f"  Preprocessor:         {cached_ms:8.2f} ms  ({legacy_ms / cached_ms:.2f}x)")
+    print(f"  max abs difference:   {diff:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Compare precision modes (fp32 / bf16 / int8) on latency, memory and mask agreement.
+
+Each mode runs in its own process so peak RSS is measured per mode. Masks are
+compared against fp32 with IoU (thresholded at 0.5) and mean absolute error.
+Needs the model weights (run download_models.py first).
+
+Usage: python3 -m bench.eval_precision [--images DIR] [--modes fp32,bf16,int8] [--runs 3]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+
+
+def load_images(images_dir):
+    if images_dir:
+        paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        return [(p.name, Image.open(p).convert("RGB")) for p in paths]
+    # Synthetic fallback: a bright disc on a noisy background
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 80, (1200, 1600, 3), dtype=np.uint8)
+    yy, xx = np.mgrid[:1200, :1600]
+    pixels[(yy - 600) ** 2 + (xx - 800) ** 2 < 400 ** 2] = (230, 180, 60)
+    return [("synthetic.png", Image.fromarray(pixels))]
+
+
+def run_mode(mode, images_dir, runs, out_dir):
+    """Child process: run one precision mode and save its masks"""
+    from app.core.config import settings
+    settings.DEVICE = "cpu"
+    settings.PRECISION = mode
+    from app.core.model import BackgroundRemover, peak_rss_mb
+
+    remover = BackgroundRemover()
+    images = load_images(images_dir)
+    remover.predict_masks([images[0][1]])  # warm up
+
+    latencies = []
+    for name, image in images:
+        for _ in range(runs):
+            start = time.perf_counter()
+            mask = remover.predict_masks([image])[0]
+            latencies.append((time.perf_counter() - start) * 1000)
+        np.save(Path(out_dir) / f"{mode}_{name}.npy", np.asarray(mask))
+
+    print(json.dumps({
+        "mode": remover.precision,
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_mean": float(np.mean(latencies)),
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def compare(reference, candidate):
+    ref, cand = reference.astype(np.float32) / 255, candidate.astype(np.float32) / 255
+    ref_bin, cand_bin = ref > 0.5, cand > 0.5
+    union = np.logical_or(ref_bin, cand_bin).sum()
+    iou = np.logical_and(ref_bin, cand_bin).sum() / union if union else 1.0
+    return float(iou), float(np.abs(ref - cand).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", help="Directory of evaluation images (default: synthetic image)")
+    parser.add_argument("--modes", default="fp32,bf16,int8")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--out-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args.child, args.images, args.runs, args.out_dir)
+        return
+
+    modes = args.modes.split(",")
+    if "fp32" not in modes:
+        modes.insert(0, "fp32")
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        results = []
+        for mode in modes:
+            cmd = [sys.executable, "-m", "bench.eval_precision", "--child", mode,
+                   "--runs", str(args.runs), "--out-dir", out_dir]
+            if args.images:
+                cmd += ["--images", args.images]
+            output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+        names = [name for name, _ in load_images(args.images)]
+        for result in results:
+            scores = [
+                compare(np.load(Path(out_dir) / f"fp32_{name}.npy"), np.load(Path(out_dir) / f"{result['mode']}_{name}.npy"))
+                for name in names
+            ]
+            result["iou_vs_fp32"] = float(np.mean([iou for iou, _ in scores]))
+            result["mae_vs_fp32"] = float(np.mean([mae for _, mae in scores]))
+
+    print(f"{'mode':6} {'p50 ms':>9} {'peak RSS MB':>12} {'IoU':>7} {'MAE':>8}")
+    for r in results:
+        print(f"{r['mode']:6} {r['latency_ms_p50']:9.1f} {str(r['peak_rss_mb']):>12} {r['iou_vs_fp32']:7.4f} {r['mae_vs_fp32']:8.5f}")
+
+
+if __name__ == "__main__":
+    main()
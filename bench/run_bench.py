@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Stage-level benchmark suite for the background removal pipeline.
+
+Runs the real BackgroundRemover pre/post-processing, compositing, encoding
+and (optionally) the /remove-bg endpoint against a deterministic stub model,
+for a matrix of image sizes and input/output formats. Results are JSON:
+p50/p95/p99 latency per stage, throughput and peak RSS.
+
+Usage: python3 -m bench.run_bench [--sizes 640x480,1920x1080,4000x3000]
+           [--formats jpeg,png,webp] [--output-formats png,jpg] [--runs 10]
+           [--endpoints] [--stub-latency-ms 0] [--output results.json]
+"""
+
+import argparse
+import io
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from bench.stub_model import make_stub_remover
+from app.core.decode import DecodedImage
+from app.core.encoding import encode_result
+from app.core.model import peak_rss_mb
+
+STAGES = ["decode", "preprocess", "inference", "postprocess", "composite", "encode"]
+
+
+def synthetic_image(width: int, height: int) -> Image.Image:
+    """Deterministic test photo: gradient background with a textured foreground blob"""
+    rng = np.random.default_rng(width * height)
+    yy, xx = np.mgrid[:height, :width].astype(np.float32)
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = (xx / width * 200).astype(np.uint8)
+    pixels[..., 1] = (yy / height * 200).astype(np.uint8)
+    pixels[..., 2] = 90
+    blob = ((xx - width / 2) / (width / 3)) ** 2 + ((yy - height / 2) / (height / 3)) ** 2 < 1
+    pixels[blob] = rng.integers(150, 256, (blob.sum(), 3), dtype=np.uint8)
+    return Image.fromarray(pixels)
+
+
+def encode_input(image: Image.Image, fmt: str) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format=fmt.upper(), **({"quality": 90} if fmt in ("jpeg", "webp") else {}))
+    return output.getvalue()
+
+
+def summarize(samples_ms):
+    values = np.asarray(samples_ms)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+
+def bench_stages(remover, data: bytes, output_format: str, runs: int):
+    """Time every stage of one image through the real pipeline code"""
+    timings = {stage: [] for stage in STAGES}
+    totals = []
+    for i in range(runs + 1):  # first iteration is warmup
+        t0 = time.perf_counter()
+        image = DecodedImage(io.BytesIO(data))
+        input_size = remover.select_input_size(image.size)
+        preview = image.preview(input_size)
+        t1 = time.perf_counter()
+        input_tensor = remover.preprocess_batch([preview], input_size)
+        t2 = time.perf_counter()
+        preds = remover._forward(input_tensor)
+        t3 = time.perf_counter()
+        mask_array = remover.mask_to_array(preds[0], image.size)
+        mask_image = Image.frombuffer("L", image.size, mask_array, "raw", "L", 0, 1)
+        t4 = time.perf_counter()
+        # The full resolution is decoded lazily, right before compositing
+        full = image.full()
+        t5 = time.perf_counter()
+        result_image = remover.apply_mask(full, mask_image)
+        t6 = time.perf_counter()
+        encoded = encode_result(result_image, output_format)
+        t7 = time.perf_counter()
+
+        if i == 0:
+            continue
+        durations = {
+            "decode": (t1 - t0) + (t5 - t4),
+            "preprocess": t2 - t1,
+            "inference": t3 - t2,
+            "postprocess": t4 - t3,
+            "composite": t6 - t5,
+            "encode": t7 - t6,
+        }
+        for stage, seconds in durations.items():
+            timings[stage].append(seconds * 1000)
+        totals.append((t7 - t0) * 1000)
+
+    result = {stage: summarize(samples) for stage, samples in timings.items()}
+    result["total"] = summarize(totals)
+    result["throughput_img_s"] = round(1000 / float(np.mean(totals)), 2)
+    result["output_bytes"] = len(encoded.result)
+    return result
+
+
+def bench_endpoint(remover, data: bytes, fmt: str, output_format: str, runs: int):
+    """Time POST /remove-bg end to end through FastAPI's TestClient"""
+    from fastapi.testclient import TestClient
+    from app.api import endpoints
+    from app.main import app
+
+    endpoints.bg_remover = remover
+    client = TestClient(app)
+    samples = []
+    for i in range(runs + 1):
+        start = time.perf_counter()
+        response = client.post(
+            "/remove-bg",
+            params={"output_format": output_format},
+            files={"files": (f"bench.{fmt}", data, f"image/{fmt}")},
+        )
+        response.raise_for_status()
+        if i:
+            samples.append((time.perf_counter() - start) * 1000)
+    result = summarize(samples)
+    result["throughput_img_s"] = round(1000 / float(np.mean(samples)), 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="640x480,1920x1080,4000x3000")
+    parser.add_argument("--formats", default="jpeg,png,webp", help="Input image formats")
+    parser.add_argument("--output-formats", default="png,jpg")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--endpoints", action="store_true", help="Also benchmark POST /remove-bg")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="Simulated model time per image")
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    remover = make_stub_remover(args.stub_latency_ms)
+    cases = []
+    for size in args.sizes.split(","):
+        width, height = (int(v) for v in size.split("x"))
+        image = synthetic_image(width, height)
+        for fmt in args.formats.split(","):
+            data = encode_input(image, fmt)
+            for output_format in args.output_formats.split(","):
+                case = {
+                    "size": size,
+                    "megapixels": round(width * height / 1e6, 2),
+                    "input_format": fmt,
+                    "input_bytes": len(data),
+                    "output_format": output_format,
+                    "stages": bench_stages(remover, data, output_format, args.runs),
+                }
+                if args.endpoints:
+                    case["endpoint"] = bench_endpoint(remover, data, fmt, output_format, args.runs)
+                cases.append(case)
+                print(f"{size} {fmt} -> {output_format}: {case['stages']['total']['p50_ms']} ms p50", file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": args.runs,
+        "stub_latency_ms": args.stub_latency_ms,
+        "peak_rss_mb": peak_rss_mb(),
+        "cases": cases,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
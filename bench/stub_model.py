@@ -0,0 +1,40 @@
+"""
+Deterministic stand-in for RMBG-2.0 so benchmarks run offline without the gated weights.
+"""
+
+import time
+import torch
+
+from app.core.backends import InferenceBackend
+
+
+class StubBackend(InferenceBackend):
+    """Predicts a soft mask from local contrast with a few cheap tensor ops.
+
+    ``latency_ms`` adds a fixed per-image sleep to mimic model cost, so
+    batching and queueing behave like the real service.
+    """
+
+    name = "stub"
+
+    def __init__(self, device: torch.device = torch.device("cpu"), latency_ms: float = 0.0):
+        self.device = device
+        self.latency_ms = latency_ms
+
+    def forward(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        if self.latency_ms:
+            time.sleep(self.latency_ms * input_tensor.shape[0] / 1000)
+        with torch.no_grad():
+            gray = input_tensor.mean(dim=1, keepdim=True)
+            blurred = torch.nn.functional.avg_pool2d(gray, 9, stride=1, padding=4)
+            masks = torch.sigmoid((blurred - gray.mean(dim=(2, 3), keepdim=True)) * 4)
+        return masks[:, 0]
+
+
+def make_stub_remover(latency_ms: float = 0.0):
+    """BackgroundRemover on CPU with the stub backend and the result cache disabled"""
+    from app.core.config import settings
+    settings.DEVICE = "cpu"
+    settings.CACHE_ENABLED = False
+    from app.core.model import BackgroundRemover
+    return BackgroundRemover(backend=StubBackend(latency_ms=latency_ms))
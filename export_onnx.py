@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Export RMBG-2.0 (model.safetensors) to ONNX graphs, one per inference size, for the onnx backend
+"""
+
+import argparse
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import torch
+from torch.onnx import register_custom_op_symbolic
+from torch.onnx.symbolic_helper import parse_args
+
+from app.core.config import settings
+from app.core.backends import masks_from_output
+
+# BiRefNet's decoder (ASPPDeformable) uses torchvision's deform_conv2d, which the
+# exporter has no symbolic for; ONNX has DeformConv from opset 19 on
+MIN_OPSET = 19
+
+
+@parse_args("v", "v", "v", "v", "v", "i", "i", "i", "i", "i", "i", "i", "i", "b")
+def _deform_conv2d(g, input, weight, offset, mask, bias, stride_h, stride_w, pad_h, pad_w,
+                   dilation_h, dilation_w, groups, offset_groups, use_mask):
+    inputs = [input, weight, offset, bias] + ([mask] if use_mask else [])
+    return g.op(
+        "DeformConv", *inputs,
+        dilations_i=[dilation_h, dilation_w],
+        group_i=groups,
+        kernel_shape_i=weight.type().sizes()[2:],
+        offset_group_i=offset_groups,
+        pads_i=[pad_h, pad_w, pad_h, pad_w],
+        strides_i=[stride_h, stride_w],
+    )
+
+
+class MaskModel(torch.nn.Module):
+    """Wraps BiRefNet so the graph outputs sigmoid masks of shape (B, 1, H, W)"""
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return masks_from_output(self.model(x)).unsqueeze(1)
+
+
+def export_model(model: torch.nn.Module, output_path: Path, input_size: int, opset: int):
+    """Export model with a dynamic batch dimension"""
+    if opset < MIN_OPSET:
+        raise ValueError(f"opset {opset} has no DeformConv, use {MIN_OPSET} or later")
+    register_custom_op_symbolic("torchvision::deform_conv2d", _deform_conv2d, MIN_OPSET)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    print(f"Exporting to {output_path} (opset {opset}, input {input_size}x{input_size})...")
+    example = torch.randn(1, 3, input_size, input_size)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            example,
+            str(output_path),
+            input_names=["input"],
+            output_names=["mask"],
+            dynamic_axes={"input": {0: "batch"}, "mask": {0: "batch"}},
+            opset_version=opset,
+            do_constant_folding=True,
+            dynamo=False,
+        )
+
+
+def verify_export(model: torch.nn.Module, output_path: Path, input_size: int, tolerance: float) -> float:
+    """Run the graph in ONNX Runtime on a batch of 2 and compare with torch, returns the max abs difference"""
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(str(output_path), providers=["CPUExecutionProvider"])
+    inputs = torch.randn(2, 3, input_size, input_size)
+    with torch.no_grad():
+        expected = model(inputs).numpy()
+    actual = session.run(None, {"input": inputs.numpy()})[0]
+    if actual.shape != expected.shape:
+        raise RuntimeError(f"ONNX output shape {actual.shape} != torch output shape {expected.shape}")
+    diff = float(np.abs(actual - expected).max())
+    print(f"Max abs difference between ONNX Runtime and torch masks: {diff:.2e}")
+    if diff > tolerance:
+        raise RuntimeError(f"ONNX masks differ from torch by {diff:.2e} (tolerance {tolerance:.0e})")
+    return diff
+
+
+def export_onnx(output_dir: Path, input_sizes: List[int], opset: int, verify: bool = True, tolerance: float = 1e-3):
+    """Load the torch model on CPU in fp32 and export one graph per input size, each checked against torch.
+
+    The input size stays fixed in each graph: BiRefNet's Swin backbone derives
+    its window padding and attention masks from the input size at trace time.
+    """
+    settings.DEVICE = "cpu"
+    settings.BACKEND = "torch"
+    settings.PRECISION = "fp32"
+    settings.COMPILE_MODE = "off"
+    from app.core.model import BackgroundRemover
+
+    remover = BackgroundRemover()
+    model = MaskModel(remover.model).eval()
+    for input_size in input_sizes:
+        output_path = output_dir / f"model_{input_size}.onnx"
+        export_model(model, output_path, input_size, opset)
+        if verify:
+            verify_export(model, output_path, input_size, tolerance)
+    print(f"✅ Exported ONNX models for sizes {input_sizes} to {output_dir.absolute()}")
+    print(f"Use them with: RMBG_BACKEND=onnx RMBG_ONNX_MODEL_PATH={output_dir}")
+
+
+if __name__ == "__main__":
+    from app.core.model import BUNDLED_MODEL_DIR
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output-dir", type=Path, default=BUNDLED_MODEL_DIR / "onnx")
+    parser.add_argument(
+        "--input-sizes", type=lambda value: [int(size) for size in value.split(",")],
+        default=sorted(set(settings.INFERENCE_SIZES) | {settings.REFINE_TILE_SIZE}),
+        help="comma separated input sizes, one graph each (default: RMBG_INFERENCE_SIZES and the refinement tile size)"
+    )
+    parser.add_argument("--opset", type=int, default=MIN_OPSET)
+    parser.add_argument("--no-verify", action="store_true", help="skip comparing ONNX Runtime output with torch")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="max abs mask difference accepted by the check")
+    args = parser.parse_args()
+    export_onnx(args.output_dir, args.input_sizes, args.opset, not args.no_verify, args.tolerance)
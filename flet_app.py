@@ -10,6 +10,7 @@ from typing import List, Dict
 from PIL import Image
 import uvicorn
 from app.core.model import BackgroundRemover
+from app.core.decode import DecodedImage
 from app.core import config
 from app.api import endpoints
 from app.main import app as fastapi_app
@@ -237,6 +238,8 @@ def main(page: ft.Page):
                 return
             
             endpoints.bg_remover = remover
+            # The model is already loaded for the UI; skip warming every size and batch size
+            config.settings.WARMUP_FULL = False
             
             def run_server():
                 global api_server_instance
@@ -376,6 +379,7 @@ def main(page: ft.Page):
                     'size': Path(path).stat().st_size,
                     'status': 'pending',  # pending, processing, done, error
                     'result_path': None,
+                    'error': None,
                     'thumbnail': thumb
                 })
         
@@ -653,7 +657,8 @@ def main(page: ft.Page):
                                 content=ft.Icon(
                                     ft.icons.ERROR_OUTLINE,
                                     size=48,
-                                    color=Colors.ERROR
+                                    color=Colors.ERROR,
+                                    tooltip=file_data.get('error')
                                 ),
                                 alignment=ft.alignment.center,
                                 visible=status == 'error'
@@ -809,43 +814,80 @@ def main(page: ft.Page):
         progress_indicator.update()
         progress_text.update()
     
+    def mark_failed(file_data, error):
+        print(f"Processing error ({file_data['name']}): {error}")
+        file_data['status'] = 'error'
+        file_data['error'] = error
+    
+    def remove_one(file_data, image, size):
+        try:
+            return remover.remove_background(image, input_size=size)
+        except Exception as e:
+            mark_failed(file_data, str(e))
+            return None
+    
     def process_images_thread():
         """Background processing thread"""
         global processed_results
         
-        for idx, file_data in enumerate(files_to_process):
-            if file_data['status'] != 'pending':
-                continue
+        pending = [f for f in files_to_process if f['status'] == 'pending']
+        batch_size = config.settings.BATCH_MAX_SIZE
+        
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
             
-            try:
-                # Update status
+            # Decode each file on its own (EXIF orientation, draft-size preview)
+            # so a broken file only fails itself
+            batch = []
+            for file_data in chunk:
                 file_data['status'] = 'processing'
-                update_file_list()
-                
-                # Process image
-                result_img = remover.remove_background(file_data['path'])
-                
-                # Save to temp
-                temp_path = Path(TEMP_DIR) / f"no_bg_{file_data['name']}"
-                result_img.save(str(temp_path))
-                
-                # Update thumbnail with processed image
                 try:
-                    thumb_img = result_img.copy()
-                    thumb_img.thumbnail((300, 300), Image.Resampling.LANCZOS)
-                    thumb_buffer = io.BytesIO()
-                    thumb_img.save(thumb_buffer, format='PNG')
-                    file_data['thumbnail'] = base64.b64encode(thumb_buffer.getvalue()).decode()
+                    image = DecodedImage(file_data['path'])
+                    size = remover.select_input_size(image.size)
+                    image.preview(size)
+                    batch.append((file_data, image, size))
                 except Exception as e:
-                    print(f"Error updating thumbnail: {e}")
-
-                file_data['result_path'] = str(temp_path)
-                file_data['status'] = 'done'
-                processed_results[file_data['path']] = str(temp_path)
-                
+                    mark_failed(file_data, f"Not a valid image: {e}")
+            update_file_list()
+            
+            try:
+                # Process the whole chunk in one forward pass
+                results = remover.remove_background_batch(
+                    [image for _, image, _ in batch], input_size=[size for _, _, size in batch]
+                )
             except Exception as e:
-                print(f"Processing error: {e}")
-                file_data['status'] = 'error'
+                if len(batch) == 1:
+                    mark_failed(batch[0][0], str(e))
+                    results = [None]
+                else:
+                    # Retry one by one to find the image that broke the batch
+                    print(f"Batch failed ({e}), retrying its images one by one")
+                    results = [remove_one(file_data, image, size) for file_data, image, size in batch]
+            
+            for (file_data, _, _), result_img in zip(batch, results):
+                if result_img is None:
+                    continue
+                try:
+                    # Save to temp
+                    temp_path = Path(TEMP_DIR) / f"no_bg_{file_data['name']}"
+                    result_img.save(str(temp_path))
+                    
+                    # Update thumbnail with processed image
+                    try:
+                        thumb_img = result_img.copy()
+                        thumb_img.thumbnail((300, 300), Image.Resampling.LANCZOS)
+                        thumb_buffer = io.BytesIO()
+                        thumb_img.save(thumb_buffer, format='PNG')
+                        file_data['thumbnail'] = base64.b64encode(thumb_buffer.getvalue()).decode()
+                    except Exception as e:
+                        print(f"Error updating thumbnail: {e}")
+
+                    file_data['result_path'] = str(temp_path)
+                    file_data['status'] = 'done'
+                    processed_results[file_data['path']] = str(temp_path)
+                    
+                except Exception as e:
+                    mark_failed(file_data, str(e))
             
             # Update progress
             update_progress_ui()
@@ -864,6 +906,7 @@ def main(page: ft.Page):
         for f in files_to_process:
             if f['status'] == 'error':
                 f['status'] = 'pending'
+                f['error'] = None
         
         threading.Thread(target=process_images_thread, daemon=True).start()
         
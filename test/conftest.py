@@ -0,0 +1,17 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Unit tests import the service package from the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# test_api.py is a script run against a live server (python3 test/test_api.py), not a pytest module
+collect_ignore = ["test_api.py"]
+
+
+@pytest.fixture(scope="session")
+def stub_remover():
+    """BackgroundRemover with the deterministic benchmark stub backend (no weights needed)"""
+    from bench.stub_model import make_stub_remover
+    return make_stub_remover()
@@ -2,6 +2,7 @@
 import requests
 import base64
 import os
+import time
 from pathlib import Path
 
 # Configuration
@@ -22,6 +23,17 @@ def test_health():
         return False
     return True
 
+def test_ready():
+    print(f"\nTesting Readiness Check ({API_URL}/ready)...")
+    try:
+        response = requests.get(f"{API_URL}/ready")
+        if response.status_code == 200:
+            print("✅ Readiness Check Passed:", response.json())
+        else:
+            print("❌ Service not ready yet:", response.status_code, response.text)
+    except requests.exceptions.ConnectionError:
+        print(f"❌ Could not connect to {API_URL}. Is the server running?")
+
 def test_remove_bg():
     print(f"\nTesting Remove Background ({API_URL}/remove-bg)...")
     
@@ -54,6 +66,62 @@ def test_remove_bg():
     except Exception as e:
         print(f"❌ Error during request: {e}")
 
+def test_remove_bg_webp():
+    print(f"\nTesting WebP negotiation ({API_URL}/remove-bg, Accept: image/webp)...")
+
+    if not TEST_IMAGE_PATH.exists():
+        print(f"❌ Test image not found at {TEST_IMAGE_PATH}")
+        return
+
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    files = {
+        'files': ('test.png', open(TEST_IMAGE_PATH, 'rb'), 'image/png')
+    }
+
+    try:
+        response = requests.post(f"{API_URL}/remove-bg", files=files, headers={'Accept': 'image/webp'})
+
+        if response.status_code == 200 and response.headers.get('content-type') == 'image/webp':
+            output_path = OUTPUT_DIR / "result_binary.webp"
+            with open(output_path, 'wb') as f:
+                f.write(response.content)
+            print(f"✅ WebP Passed ({response.headers.get('X-Output-Bytes')} bytes, "
+                  f"encoded in {response.headers.get('X-Encode-Time-Ms')} ms). Saved to {output_path}")
+        else:
+            print("❌ WebP Failed:", response.status_code, response.headers.get('content-type'))
+    except Exception as e:
+        print(f"❌ Error during request: {e}")
+
+def test_remove_bg_binary():
+    print(f"\nTesting Remove Background Binary ({API_URL}/remove-bg-binary)...")
+
+    if not TEST_IMAGE_PATH.exists():
+        print(f"❌ Test image not found at {TEST_IMAGE_PATH}")
+        return
+
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    try:
+        with open(TEST_IMAGE_PATH, 'rb') as f:
+            response = requests.post(
+                f"{API_URL}/remove-bg-binary",
+                data=f,
+                params={'mask_only': 'true', 'mask_format': 'raw'},
+                headers={'Content-Type': 'application/octet-stream'}
+            )
+
+        if response.status_code == 200:
+            height, width = (int(v) for v in response.headers['X-Mask-Shape'].split(','))
+            if len(response.content) == height * width:
+                print(f"✅ Remove BG Binary Passed ({width}x{height} raw mask)")
+            else:
+                print(f"❌ Remove BG Binary Failed: {len(response.content)} bytes for a {width}x{height} mask")
+        else:
+            print("❌ Remove BG Binary Failed:", response.status_code, response.text)
+    except Exception as e:
+        print(f"❌ Error during request: {e}")
+
 def test_remove_bg_base64():
     print(f"\nTesting Remove Background Base64 ({API_URL}/remove-bg-base64)...")
     
@@ -91,11 +159,54 @@ def test_remove_bg_base64():
     except Exception as e:
         print(f"❌ Error during request: {e}")
 
+def test_jobs():
+    print(f"\nTesting Job API ({API_URL}/jobs)...")
+
+    if not TEST_IMAGE_PATH.exists():
+        print(f"❌ Test image not found at {TEST_IMAGE_PATH}")
+        return
+
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    files = [
+        ('files', ('test.png', open(TEST_IMAGE_PATH, 'rb'), 'image/png')),
+        ('files', ('test2.png', open(TEST_IMAGE_PATH, 'rb'), 'image/png'))
+    ]
+
+    try:
+        response = requests.post(f"{API_URL}/jobs", files=files)
+        if response.status_code != 202:
+            print("❌ Job creation Failed:", response.status_code, response.text)
+            return
+        job_id = response.json()['id']
+
+        for _ in range(120):
+            status = requests.get(f"{API_URL}/jobs/{job_id}").json()
+            if status['status'] in ('done', 'failed'):
+                break
+            time.sleep(1)
+
+        if status['status'] != 'done':
+            print("❌ Job Failed:", status)
+            return
+
+        response = requests.get(f"{API_URL}/jobs/{job_id}/results")
+        output_path = OUTPUT_DIR / "job_results.zip"
+        with open(output_path, 'wb') as f:
+            f.write(response.content)
+        print(f"✅ Job API Passed ({status['done']}/{status['total']} done). Saved to {output_path}")
+    except Exception as e:
+        print(f"❌ Error during request: {e}")
+
 if __name__ == "__main__":
     print("--- RMBG-2.0 API Test Script ---")
     if test_health():
+        test_ready()
         test_remove_bg()
+        test_remove_bg_webp()
+        test_remove_bg_binary()
         test_remove_bg_base64()
+        test_jobs()
     else:
         print("\nPlease start the server first:")
         print("python3 run.py")
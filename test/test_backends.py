@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from app.core.backends import OnnxBackend, masks_from_output
+from app.core.config import settings
+
+pytest.importorskip("onnxruntime")
+
+
+class TinyMaskModel(torch.nn.Module):
+    """Stands in for the exported graph: (B, 3, S, S) -> sigmoid masks (B, 1, S, S)"""
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.conv = torch.nn.Conv2d(3, 1, 3, padding=1)
+
+    def forward(self, x):
+        return self.conv(x).sigmoid()
+
+
+@pytest.fixture(scope="module")
+def model():
+    return TinyMaskModel().eval()
+
+
+@pytest.fixture(scope="module")
+def onnx_dir(tmp_path_factory, model):
+    """One fixed-size graph per input size, named like export_onnx.py names them"""
+    directory = tmp_path_factory.mktemp("onnx")
+    for size in (32, 64):
+        torch.onnx.export(
+            model, torch.randn(1, 3, size, size), str(directory / f"model_{size}.onnx"),
+            input_names=["input"], output_names=["mask"], dynamic_axes={"input": {0: "batch"}, "mask": {0: "batch"}},
+            opset_version=17, dynamo=False,
+        )
+    return directory
+
+
+def test_masks_from_output_takes_the_last_prediction():
+    preds = [torch.full((2, 1, 4, 4), -100.0), torch.zeros(2, 1, 4, 4)]
+    masks = masks_from_output(preds)
+    assert masks.shape == (2, 4, 4)
+    assert torch.allclose(masks, torch.full((2, 4, 4), 0.5))
+
+
+def test_onnx_backend_runs_one_graph_per_size(onnx_dir, model):
+    backend = OnnxBackend(onnx_dir, torch.device("cpu"))
+    assert backend.input_sizes == [32, 64]
+    for size in backend.input_sizes:
+        inputs = torch.randn(3, 3, size, size)
+        with torch.no_grad():
+            expected = model(inputs)[:, 0]
+        assert torch.allclose(backend.forward(inputs), expected, atol=1e-5)
+    with pytest.raises(ValueError):
+        backend.forward(torch.randn(1, 3, 48, 48))
+
+
+def test_missing_graphs_are_reported(tmp_path):
+    with pytest.raises(RuntimeError, match="export_onnx.py"):
+        OnnxBackend(tmp_path, torch.device("cpu"))
+
+
+def test_remover_only_uses_sizes_the_graphs_support(onnx_dir, monkeypatch):
+    monkeypatch.setattr(settings, "DEVICE", "cpu")
+    monkeypatch.setattr(settings, "INFERENCE_SIZES", [32, 48, 64])
+    monkeypatch.setattr(settings, "REFINE_ENABLED", True)
+    from app.core.model import BackgroundRemover
+
+    remover = BackgroundRemover(backend=OnnxBackend(onnx_dir, torch.device("cpu")))
+    assert remover.input_sizes == [32, 64]
+    # No graph for the refinement tile size
+    assert not remover.can_refine
+    mask = remover.predict_masks([Image.new("RGB", (50, 40), "red")], 32)[0]
+    assert mask.size == (50, 40)
+    assert 0 < np.asarray(mask).mean() < 255
@@ -0,0 +1,88 @@
+from app.core.cache import ResultCache
+from app.core.encoding import EncodedResult
+
+
+def entry(data: bytes, mask: bytes = None) -> EncodedResult:
+    return EncodedResult(data, "image/png", "png", mask, size=(4, 3))
+
+
+def test_memory_lru_evicts_least_recently_used():
+    cache = ResultCache(memory_bytes=30)
+    for key in "abc":
+        cache.put(key, entry(key.encode() * 10))
+    assert cache.get("a") is not None  # "a" is now the most recently used
+    cache.put("d", entry(b"d" * 10))
+
+    assert cache.get("b") is None
+    assert cache.get("a").result == b"a" * 10
+    assert cache.get("c") is not None and cache.get("d") is not None
+    stats = cache.stats()
+    assert stats["memory_entries"] == 3 and stats["memory_bytes"] == 30
+    assert stats["misses"] == 1
+
+
+def test_entry_larger_than_memory_is_not_kept():
+    cache = ResultCache(memory_bytes=8)
+    cache.put("big", entry(b"x" * 9))
+    assert cache.get("big") is None
+    assert cache.stats()["memory_entries"] == 0
+
+
+def test_mask_counts_towards_memory_size():
+    cache = ResultCache(memory_bytes=20)
+    cache.put("a", entry(b"a" * 10, b"m" * 5))
+    cache.put("b", entry(b"b" * 5))
+    assert cache.stats()["memory_bytes"] == 20
+    cache.put("c", entry(b"c"))
+    assert cache.get("a") is None
+
+
+def test_disk_tier_hit_and_miss(tmp_path):
+    cache = ResultCache(memory_bytes=0, disk_dir=str(tmp_path), disk_bytes=1 << 20)
+    cache.put("k1", entry(b"result", b"mask"))
+
+    hit = cache.get("k1")
+    assert hit == EncodedResult(b"result", "image/png", "png", b"mask", size=(4, 3))
+    assert cache.get("missing") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_disk_hit_is_promoted_to_memory(tmp_path):
+    cache = ResultCache(memory_bytes=1 << 20, disk_dir=str(tmp_path), disk_bytes=1 << 20)
+    cache.put("k1", entry(b"result"))
+    reopened = ResultCache(memory_bytes=1 << 20, disk_dir=str(tmp_path), disk_bytes=1 << 20)
+
+    assert reopened.stats()["disk_entries"] == 1
+    assert reopened.get("k1").result == b"result"
+    assert reopened.get("k1").result == b"result"
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_evicts_oldest_entries(tmp_path):
+    cache = ResultCache(memory_bytes=0, disk_dir=str(tmp_path), disk_bytes=1 << 20)
+    cache.put("old", entry(b"x" * 100))
+    # Room for exactly two entries of this size
+    cache.disk_bytes = cache.stats()["disk_bytes"] * 2
+    cache.put("new1", entry(b"y" * 100))
+    cache.put("new2", entry(b"z" * 100))
+
+    assert cache.get("old") is None
+    assert cache.get("new2").result == b"z" * 100
+    assert len(list(tmp_path.glob("*/*.bin"))) == 2
+
+
+def test_unreadable_disk_entry_is_dropped(tmp_path):
+    cache = ResultCache(memory_bytes=0, disk_dir=str(tmp_path), disk_bytes=1 << 20)
+    cache.put("k1", entry(b"result"))
+    cache._path("k1").write_bytes(b"\x00\x00\x00\x05{bad")
+
+    assert cache.get("k1") is None
+    assert cache.stats()["disk_entries"] == 0
+
+
+def test_make_key_depends_on_every_parameter():
+    key = ResultCache.make_key("digest", output_format="png", input_size=1024)
+    assert key == ResultCache.make_key("digest", input_size=1024, output_format="png")
+    assert key != ResultCache.make_key("digest", output_format="webp", input_size=1024)
+    assert key != ResultCache.make_key("other", output_format="png", input_size=1024)
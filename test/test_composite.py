@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+from app.core.composite import Background, composite
+
+
+def reference(image: Image.Image, mask: Image.Image, background: np.ndarray) -> np.ndarray:
+    alpha = np.asarray(mask, dtype=np.float64)[..., None] / 255
+    blended = np.asarray(image, dtype=np.float64) * alpha + background * (1 - alpha)
+    return np.floor(blended + 0.5)
+
+
+def random_inputs(width: int, height: int, seed: int):
+    rng = np.random.default_rng(seed)
+    image = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+    mask = Image.fromarray(rng.integers(0, 256, (height, width), dtype=np.uint8))
+    return image, mask
+
+
+def test_color_background_matches_float_blend():
+    image, mask = random_inputs(70, 150, 0)
+    result = composite(image, mask, Background.parse("#102030"))
+    expected = reference(image, mask, np.array([16, 32, 48], dtype=np.float64))
+    assert np.abs(np.asarray(result, dtype=np.int16) - expected).max() <= 1
+
+
+@pytest.mark.parametrize("spec", ["gradient:black:white", "gradient:red:blue:horizontal"])
+def test_gradient_spans_the_whole_image(spec):
+    width, height = 90, 200
+    image = Image.new("RGB", (width, height))
+    result = np.asarray(composite(image, Image.new("L", (width, height), 0), Background.parse(spec)))
+    start, end = result[0, 0], result[-1, -1]
+    first, last = spec.split(":")[1:3]
+    assert tuple(start) == Image.new("RGB", (1, 1), first).getpixel((0, 0))
+    assert tuple(end) == Image.new("RGB", (1, 1), last).getpixel((0, 0))
+
+
+def test_image_background_is_fitted_to_each_size():
+    rng = np.random.default_rng(1)
+    backdrop = Image.fromarray(rng.integers(0, 256, (100, 160, 3), dtype=np.uint8))
+    background = Background.from_image(backdrop, "digest")
+    # One Background is shared by every image of a request, in any order of sizes
+    for width, height in [(64, 48), (30, 90), (64, 48)]:
+        image, mask = random_inputs(width, height, width)
+        fitted = np.asarray(ImageOps.fit(backdrop, (width, height), Image.Resampling.BILINEAR), dtype=np.float64)
+        result = composite(image, mask, background)
+        assert np.abs(np.asarray(result, dtype=np.int16) - reference(image, mask, fitted)).max() <= 1
@@ -0,0 +1,70 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+from app.core.decode import DecodedImage
+
+
+def encoded(image: Image.Image, fmt: str = "JPEG", orientation: int = 1) -> io.BytesIO:
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    output = io.BytesIO()
+    image.save(output, format=fmt, exif=exif, quality=95)
+    output.seek(0)
+    return output
+
+
+def asymmetric(width: int = 120, height: int = 80) -> Image.Image:
+    """Red left half and a blue bottom band, so any rotation or flip shows"""
+    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+    pixels[:, :width // 2, 0] = 255
+    pixels[height * 3 // 4:, :, 2] = 255
+    return Image.fromarray(pixels)
+
+
+def assert_close(actual: Image.Image, expected: Image.Image):
+    assert actual.size == expected.size
+    diff = np.abs(np.asarray(actual, dtype=np.int16) - np.asarray(expected.convert("RGB"), dtype=np.int16))
+    assert diff.mean() < 8
+
+
+@pytest.mark.parametrize("orientation", [1, 3, 6, 8])
+def test_exif_orientation_is_applied(orientation):
+    data = encoded(asymmetric(), orientation=orientation)
+    expected = ImageOps.exif_transpose(Image.open(encoded(asymmetric(), orientation=orientation)))
+    image = DecodedImage(data)
+    # The oriented size is known from the header, before any pixels are decoded
+    assert image.size == expected.size
+    assert_close(image.full(), expected)
+    assert_close(image.preview(max(expected.size)), expected)
+
+
+def test_jpeg_preview_uses_the_draft_decode():
+    image = DecodedImage(encoded(asymmetric(2000, 1500)))
+    preview = image.preview(512)
+    # DCT scaling by 1/2 is the smallest that keeps both sides >= 512
+    assert preview.size == (1000, 750)
+    assert image.full().size == (2000, 1500)
+
+
+def test_rotated_jpeg_preview_keeps_both_sides_large_enough():
+    image = DecodedImage(encoded(asymmetric(2000, 1500), orientation=6))
+    assert image.size == (1500, 2000)
+    assert image.preview(512).size == (750, 1000)
+
+
+def test_png_preview_is_reduced_and_reuses_the_full_decode():
+    image = DecodedImage(encoded(asymmetric(1200, 900), fmt="PNG"))
+    preview = image.preview(300)
+    assert preview.size == (400, 300)
+    full = image.full()
+    assert full.size == (1200, 900)
+    assert image.full() is full
+
+
+def test_result_matches_the_oriented_input(stub_remover):
+    image = DecodedImage(encoded(asymmetric(), orientation=6))
+    result, mask = stub_remover.remove_background(image, return_mask=True)
+    assert result.size == mask.size == (80, 120)
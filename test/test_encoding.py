@@ -0,0 +1,94 @@
+import io
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.core import encoding
+from app.core.encoding import encode_mask, mask_rle, negotiate_format
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, "png"),
+    ("", "png"),
+    ("*/*", "png"),
+    ("image/*", "png"),
+    ("image/*;q=1.0, */*;q=0.8", "png"),
+    ("image/webp", "webp"),
+    ("image/webp,image/*,*/*;q=0.8", "webp"),
+    ("image/png;q=0.9, image/webp;q=0.5", "png"),
+    ("image/webp;q=0.5, image/jpeg;q=0.7", "jpeg"),
+    ("image/jpeg, image/webp", "webp"),  # equal q: NEGOTIATED_FORMATS order
+    ("image/webp;q=0", "png"),
+    ("IMAGE/WEBP ; q=0.3", "webp"),
+    ("image/webp;q=abc, image/png;q=0.1", "png"),
+    ("text/html, application/json", "png"),
+])
+def test_negotiate_format(accept, expected):
+    assert negotiate_format(accept) == expected
+
+
+def test_negotiate_format_default():
+    assert negotiate_format("*/*", default="jpeg") == "jpeg"
+
+
+def test_negotiate_format_avif_only_when_supported(monkeypatch):
+    monkeypatch.setattr(encoding, "AVIF_SUPPORTED", False)
+    assert negotiate_format("image/avif, image/png;q=0.5") == "png"
+    monkeypatch.setattr(encoding, "AVIF_SUPPORTED", True)
+    assert negotiate_format("image/avif, image/png;q=0.5") == "avif"
+    assert negotiate_format("image/avif, image/webp") == "webp"
+
+
+def rle_decode(rle) -> np.ndarray:
+    """Reference decoder: alternating background/foreground runs in column-major order"""
+    height, width = rle["size"]
+    flat = np.zeros(height * width, dtype=np.uint8)
+    position, value = 0, 0
+    for count in rle["counts"]:
+        flat[position:position + count] = value
+        position += count
+        value = 1 - value
+    assert position == height * width
+    return flat.reshape((height, width), order="F")
+
+
+def test_mask_rle_known_counts():
+    mask = np.array([
+        [0, 255, 255],
+        [0, 200, 0],
+    ], dtype=np.uint8)
+    # Column-major: 0 0 | 1 1 | 1 0
+    assert mask_rle(mask) == {"size": [2, 3], "counts": [2, 3, 1]}
+
+
+def test_mask_rle_leading_foreground_starts_with_zero():
+    assert mask_rle(np.full((2, 2), 255, dtype=np.uint8)) == {"size": [2, 2], "counts": [0, 4]}
+    assert mask_rle(np.zeros((2, 2), dtype=np.uint8)) == {"size": [2, 2], "counts": [4]}
+    assert mask_rle(np.zeros((0, 3), dtype=np.uint8)) == {"size": [0, 3], "counts": []}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_mask_rle_round_trip(seed):
+    rng = np.random.default_rng(seed)
+    height, width = rng.integers(1, 40, size=2)
+    # Random foreground with values on both sides of the 127/128 threshold
+    mask = (rng.random((height, width)) > 0.5).astype(np.uint8) * 255
+    mask[rng.random((height, width)) > 0.9] = 127
+    mask[rng.random((height, width)) > 0.9] = 128
+    assert np.array_equal(rle_decode(mask_rle(mask)), (mask >= 128).astype(np.uint8))
+
+
+def test_encode_mask_formats():
+    mask = np.array([[0, 127, 128, 255]] * 3, dtype=np.uint8)
+    image = Image.fromarray(mask)
+
+    assert encode_mask(image, "raw") == mask.tobytes()
+    assert json.loads(encode_mask(image, "rle")) == mask_rle(mask)
+    assert np.array_equal(np.asarray(Image.open(io.BytesIO(encode_mask(image, "png")))), mask)
+    binary = Image.open(io.BytesIO(encode_mask(image, "png1")))
+    assert binary.mode == "1"
+    assert np.array_equal(np.asarray(binary.convert("L")), np.where(mask >= 128, 255, 0))
+    with pytest.raises(ValueError):
+        encode_mask(image, "bmp")
@@ -0,0 +1,119 @@
+import base64
+import io
+import pstats
+import time
+import zipfile
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.api import endpoints
+from app.core.config import settings
+from app.main import app
+
+
+def jpeg_bytes(size=(64, 48)) -> bytes:
+    output = io.BytesIO()
+    Image.effect_noise(size, 64).convert("RGB").save(output, format="JPEG")
+    return output.getvalue()
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path, stub_remover):
+    """The app with the stub model, jobs stored under tmp_path and no warmup inferences"""
+    monkeypatch.setattr(settings, "JOBS_ENABLED", True)
+    monkeypatch.setattr(settings, "JOBS_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(settings, "WARMUP_RUNS", 0)
+    monkeypatch.setattr(endpoints, "bg_remover", stub_remover)
+    yield
+    endpoints.shutdown_services()
+
+
+@contextmanager
+def start():
+    """Run the app's lifespan; processing endpoints answer 503 until the startup warmup is done"""
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 30
+        while client.get("/ready").status_code != 200:
+            assert time.monotonic() < deadline, "warmup did not finish"
+            time.sleep(0.01)
+        yield client
+
+
+def test_jobs_work_after_the_lifespan_restarts(service):
+    # The desktop app switches the API off and on again in the same process
+    for _ in range(2):
+        with start() as client:
+            response = client.post("/jobs", files={"files": ("a.jpg", jpeg_bytes(), "image/jpeg")})
+            assert response.status_code == 202
+            assert client.get(f"/jobs/{response.json()['id']}").status_code == 200
+        assert endpoints.job_runner is None
+
+
+def test_repeated_upload_is_served_from_the_result_cache(service, monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_ENABLED", True)
+    monkeypatch.setattr(endpoints, "result_cache", None)
+    monkeypatch.setattr(endpoints, "_result_cache_created", False)
+    contents = jpeg_bytes()
+    with start() as client:
+        first, second = (
+            client.post("/remove-bg", files={"files": ("a.jpg", contents, "image/jpeg")}) for _ in range(2)
+        )
+        assert first.content == second.content
+        assert "X-Encode-Time-Ms" in first.headers and "X-Encode-Time-Ms" not in second.headers
+        assert client.get("/health").json()["cache"]["hits"] == 1
+
+
+def test_zip_reports_a_failed_image_inside_the_archive(service):
+    files = [
+        ("files", ("a.jpg", jpeg_bytes(), "image/jpeg")),
+        ("files", ("b.jpg", jpeg_bytes()[:-200], "image/jpeg")),
+    ]
+    with start() as client:
+        response = client.post("/remove-bg", files=files)
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert sorted(archive.namelist()) == ["error_b.txt", "no_bg_a.png"]
+        assert archive.testzip() is None
+
+
+@pytest.mark.parametrize("endpoint, ingest", [
+    ("/remove-bg", "ingest_file"),
+    ("/remove-bg-base64", "ingest_base64"),
+    ("/remove-bg-binary", "ingest_bytes"),
+    ("/remove-bg-base64/stream", "ingest_bytes"),
+])
+def test_profile_covers_ingestion(service, monkeypatch, tmp_path, endpoint, ingest):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(settings, "PROFILE_DIR", str(tmp_path / "profiles"))
+    contents = jpeg_bytes()
+    requests = {
+        "/remove-bg": {"files": {"files": ("a.jpg", contents, "image/jpeg")}},
+        "/remove-bg-base64": {"json": {"image_base64": base64.b64encode(contents).decode()}},
+        "/remove-bg-binary": {"content": contents},
+        "/remove-bg-base64/stream": {"content": base64.b64encode(contents)},
+    }
+    headers = {"X-RMBG-Profile": "1", "X-Admin-Token": "secret"}
+    with start() as client:
+        response = client.post(endpoint, headers=headers, **requests[endpoint])
+        assert response.status_code == 200
+        pstats_file = tmp_path / "stats"
+        pstats_file.write_bytes(client.get(
+            f"/admin/profiles/{response.headers['X-Profile-Id']}/pstats", headers=headers
+        ).content)
+    functions = {name for _, _, name in pstats.Stats(str(pstats_file)).stats}
+    assert {ingest, "decode_image", "encode_result"} <= functions
+
+
+def test_ready_is_reset_while_a_restarted_lifespan_warms_up(service, monkeypatch):
+    with start():
+        pass
+    assert endpoints.readiness["ready"]
+    warming = []
+    monkeypatch.setattr(endpoints, "warm_up", lambda: warming.append(dict(endpoints.readiness)))
+    with TestClient(app):
+        pass
+    assert warming == [{"ready": False, "warmup_seconds": None, "error": None}]
@@ -0,0 +1,131 @@
+import asyncio
+import base64
+import io
+import random
+
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.core.ingest import (
+    Base64Decoder, UploadBudget, UploadRejected, ingest_base64, ingest_bytes, probe_image, read_stream
+)
+
+
+def split_randomly(data: bytes, rng: random.Random):
+    """Cut data at random points, including empty and one-byte chunks"""
+    chunks, start = [], 0
+    while start < len(data):
+        end = min(len(data), start + rng.choice([0, 1, 2, 3, 5, 7, 64, 1000]))
+        chunks.append(data[start:end])
+        start = end
+    return chunks
+
+
+def decode_chunks(chunks) -> bytes:
+    decoder = Base64Decoder()
+    out = b"".join(decoder.feed(chunk) for chunk in chunks)
+    decoder.finish()
+    return out
+
+
+@pytest.mark.parametrize("length", [0, 1, 2, 3, 4, 5, 100, 1001, 4096])
+@pytest.mark.parametrize("prefix", [b"", b"data:image/png;base64,"])
+def test_base64_decoder_random_chunks(length, prefix):
+    rng = random.Random(length)
+    payload = bytes(rng.randrange(256) for _ in range(length))
+    # length % 3 of 1 and 2 end in "==" and "=" padding
+    text = prefix + base64.b64encode(payload)
+    for _ in range(20):
+        assert decode_chunks(split_randomly(text, rng)) == payload
+
+
+def test_base64_decoder_skips_whitespace():
+    payload = bytes(range(200))
+    text = base64.encodebytes(payload)  # 76-column lines
+    text = b"  " + text.replace(b"\n", b"\r\n\t ")
+    assert decode_chunks(split_randomly(text, random.Random(0))) == payload
+
+
+def test_base64_decoder_truncated_input():
+    decoder = Base64Decoder()
+    decoder.feed(base64.b64encode(b"abcd")[:-1])
+    with pytest.raises(UploadRejected):
+        decoder.finish()
+
+
+@pytest.mark.parametrize("text", [b"ab!d", b"YQ==YQ==", b"data:" + b"x" * 300])
+def test_base64_decoder_rejects_invalid_data(text):
+    with pytest.raises(UploadRejected) as error:
+        decode_chunks([text])
+    assert error.value.status_code == 400
+
+
+def png_bytes(size=(40, 30), fmt="PNG") -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, "blue").save(output, format=fmt)
+    return output.getvalue()
+
+
+def test_read_stream_with_base64_decoder():
+    data = png_bytes()
+    text = b"data:image/png;base64," + base64.b64encode(data)
+
+    async def chunks():
+        for chunk in split_randomly(text, random.Random(1)):
+            yield chunk
+
+    upload = asyncio.run(read_stream(chunks(), "img.png", Base64Decoder()))
+    try:
+        assert (upload.format, upload.width, upload.height) == ("PNG", 40, 30)
+        assert upload.read() == data
+    finally:
+        upload.close()
+
+
+def test_ingest_base64_rejects_bad_padding():
+    with pytest.raises(UploadRejected) as error:
+        ingest_base64("abc")
+    assert error.value.status_code == 400
+
+
+def test_probe_image_accepts_any_pillow_format():
+    for fmt in ("PNG", "JPEG", "PPM", "TGA", "ICO"):
+        assert probe_image(io.BytesIO(png_bytes((16, 16), fmt)))[1:] == (16, 16)
+
+
+def test_probe_image_rejects_non_images():
+    with pytest.raises(UploadRejected) as error:
+        probe_image(io.BytesIO(b"not an image"))
+    assert error.value.status_code == 400
+
+
+def test_probe_image_rejects_too_many_pixels(monkeypatch):
+    monkeypatch.setattr(settings, "MAX_IMAGE_PIXELS", 16 * 16 - 1)
+    with pytest.raises(UploadRejected) as error:
+        probe_image(io.BytesIO(png_bytes((16, 16))))
+    assert error.value.status_code == 413
+
+
+def test_upload_budget_refuses_what_can_never_fit_with_413():
+    budget = UploadBudget(100)
+    with pytest.raises(UploadRejected) as error:
+        budget.reserve(60, held=50, name="big.png")
+    assert error.value.status_code == 413
+    assert str(error.value).startswith("big.png: ")
+
+
+def test_upload_budget_refuses_while_full_with_503():
+    budget = UploadBudget(100)
+    budget.reserve(80)
+    with pytest.raises(UploadRejected) as error:
+        budget.reserve(30)
+    assert error.value.status_code == 503
+    budget.release(80)
+    budget.reserve(30)
+
+
+def test_invalid_upload_error_names_the_file():
+    with pytest.raises(UploadRejected) as error:
+        ingest_bytes(b"not an image", "notes.txt")
+    assert str(error.value) == "notes.txt: not a valid image (unrecognized format)"
@@ -0,0 +1,122 @@
+import io
+import time
+
+import pytest
+from PIL import Image
+
+from app.core.encoding import OutputOptions
+from app.core.jobs import DONE, FAILED, JobRunner, JobStore, options_from_json, options_to_json
+
+
+def jpeg_bytes(size=(64, 48)) -> bytes:
+    output = io.BytesIO()
+    Image.effect_noise(size, 64).convert("RGB").save(output, format="JPEG")
+    return output.getvalue()
+
+
+def wait_for(store: JobStore, job_id: str, timeout: float = 30.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = store.get(job_id)
+        if job["status"] in (DONE, FAILED):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish: {store.get(job_id)}")
+
+
+@pytest.fixture
+def runner(tmp_path, stub_remover):
+    runner = JobRunner(JobStore(str(tmp_path)), lambda: stub_remover, workers=1)
+    yield runner
+    runner.shutdown()
+
+
+def submit(runner: JobRunner, files, options=OutputOptions(return_mask=True)) -> str:
+    job_id = runner.store.create([(name, io.BytesIO(data)) for name, data in files], options_to_json(options, "auto"))
+    runner.submit(job_id)
+    return job_id
+
+
+def test_job_with_one_corrupt_input_fails_only_that_item(runner):
+    good = jpeg_bytes()
+    # The header is intact, so the failure only shows up when the pixels are decoded
+    truncated = good[:len(good) * 2 // 3]
+    with Image.open(io.BytesIO(truncated)) as image:
+        assert image.size == (64, 48)
+    job_id = submit(runner, [("a.jpg", good), ("bad.jpg", truncated), ("c.jpg", good)])
+    job = wait_for(runner.store, job_id)
+
+    assert job["status"] == DONE
+    assert [item["status"] for item in job["items"]] == [DONE, FAILED, DONE]
+    assert job["items"][1]["error"]
+    job_dir = runner.store.job_dir(job_id)
+    for item in (job["items"][0], job["items"][2]):
+        result = Image.open(job_dir / item["result_file"])
+        assert result.size == (64, 48) and result.mode == "RGBA"
+        assert Image.open(job_dir / item["mask_file"]).size == (64, 48)
+    # Inputs are removed once their result is written
+    assert not (job_dir / "input_0").exists()
+
+
+def test_job_with_only_corrupt_inputs_fails(runner):
+    job = wait_for(runner.store, submit(runner, [("bad.jpg", b"not an image")]))
+    assert job["status"] == FAILED
+    assert job["items"][0]["status"] == FAILED
+
+
+def test_unfinished_jobs_resume_on_restart(tmp_path, stub_remover):
+    store = JobStore(str(tmp_path))
+    job_id = store.create([("a.jpg", io.BytesIO(jpeg_bytes()))], options_to_json(OutputOptions(), "fast"))
+    store.close()
+
+    runner = JobRunner(JobStore(str(tmp_path)), lambda: stub_remover, workers=1)
+    try:
+        assert wait_for(runner.store, job_id)["status"] == DONE
+    finally:
+        runner.shutdown()
+
+
+def test_delete_expired_keeps_recent_jobs(tmp_path):
+    store = JobStore(str(tmp_path))
+    job_id = store.create([("a.jpg", io.BytesIO(b"x"))], options_to_json(OutputOptions(), "auto"))
+    store.set_status(job_id, DONE)
+    assert store.delete_expired(3600) == 0
+    assert store.delete_expired(-1) == 1
+    assert store.get(job_id) is None
+    assert not store.job_dir(job_id).exists()
+    store.close()
+
+
+def test_options_round_trip():
+    from app.core.composite import Background
+    options = OutputOptions("webp", True, "rle", False, Background.parse("gradient:#000:#fff"))
+    restored, quality = options_from_json(options_to_json(options, "best"))
+    assert quality == "best"
+    assert restored._replace(background=None) == options._replace(background=None)
+    assert str(restored.background) == str(options.background)
+
+
+class FailingRemover:
+    """Delegates to the stub remover but fails any batch containing a 13x13 image"""
+
+    def __init__(self, remover):
+        self.remover = remover
+
+    def select_input_size(self, *args, **kwargs):
+        return self.remover.select_input_size(*args, **kwargs)
+
+    def remove_background_batch(self, images, **kwargs):
+        if any(image.size == (13, 13) for image in images):
+            raise RuntimeError("inference failed")
+        return self.remover.remove_background_batch(images, **kwargs)
+
+
+def test_failed_batch_is_retried_one_image_at_a_time(tmp_path, stub_remover):
+    runner = JobRunner(JobStore(str(tmp_path)), lambda: FailingRemover(stub_remover), workers=1)
+    try:
+        job_id = submit(runner, [("a.jpg", jpeg_bytes()), ("b.jpg", jpeg_bytes((13, 13))), ("c.jpg", jpeg_bytes())])
+        job = wait_for(runner.store, job_id)
+    finally:
+        runner.shutdown()
+    assert [item["status"] for item in job["items"]] == [DONE, FAILED, DONE]
+    assert job["items"][1]["error"] == "inference failed"
@@ -0,0 +1,33 @@
+import torch
+from PIL import Image
+
+from app.core.preprocess import Preprocessor
+
+
+def make_preprocessor():
+    return Preprocessor(torch.device("cpu"), (32, 32), max_batch_size=2)
+
+
+def test_buffer_is_reused_up_to_max_batch_size():
+    preprocessor = make_preprocessor()
+    images = [Image.new("RGB", (40, 30), "red")] * 2
+    first = preprocessor(images)
+    assert preprocessor(images).data_ptr() == first.data_ptr()
+    assert preprocessor(images[:1]).data_ptr() == first.data_ptr()
+
+
+def test_larger_batches_do_not_grow_the_kept_buffer():
+    preprocessor = make_preprocessor()
+    kept = preprocessor([Image.new("RGB", (32, 32))] * 2)
+    large = preprocessor([Image.new("RGB", (32, 32))] * 5)
+    assert large.shape == (5, 3, 32, 32)
+    assert preprocessor._local.buffer.shape[0] == 2
+    assert preprocessor._local.buffer.data_ptr() == kept.data_ptr()
+
+
+def test_release_frees_the_buffer():
+    preprocessor = make_preprocessor()
+    preprocessor([Image.new("RGB", (32, 32))])
+    preprocessor.release()
+    assert preprocessor._local.buffer is None
+    assert preprocessor([Image.new("RGB", (32, 32))]).shape == (1, 3, 32, 32)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.core.refine import boundary_tiles, refine_mask, should_refine
+
+TILE = 32
+OVERLAP = 8
+
+
+class RedChannelRemover:
+    """Predicts each tile's red channel as its mask and records the batch sizes"""
+
+    def __init__(self):
+        self.batches = []
+
+    def predict_mask_arrays(self, crops, size):
+        assert all(crop.size == (size, size) for crop in crops)
+        self.batches.append(len(crops))
+        return [np.asarray(crop)[..., 0].copy() for crop in crops]
+
+
+@pytest.fixture(autouse=True)
+def small_tiles(monkeypatch):
+    monkeypatch.setattr(settings, "REFINE_ENABLED", True)
+    monkeypatch.setattr(settings, "REFINE_TILE_SIZE", TILE)
+    monkeypatch.setattr(settings, "REFINE_TILE_OVERLAP", OVERLAP)
+    monkeypatch.setattr(settings, "REFINE_MIN_MEGAPIXELS", 0.004)
+    monkeypatch.setattr(settings, "BATCH_MAX_SIZE", 2)
+
+
+def coarse_mask(width=100, height=80):
+    """Opaque left part, transparent right part and an uncertain 6 px wide vertical band"""
+    mask = np.zeros((height, width), dtype=np.uint8)
+    mask[:, :40] = 255
+    mask[:, 40:46] = 128
+    return mask
+
+
+def noise_image(width=100, height=80):
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def test_should_refine_only_large_images(monkeypatch):
+    assert should_refine((100, 80))
+    assert not should_refine((TILE - 1, 200))
+    monkeypatch.setattr(settings, "REFINE_ENABLED", False)
+    assert not should_refine((100, 80))
+
+
+def test_boundary_tiles_cover_the_band_only():
+    tiles, band = boundary_tiles(coarse_mask(), TILE, OVERLAP)
+    covered = np.zeros(band.shape, dtype=bool)
+    for x, y in tiles:
+        assert x <= 45 and x + TILE > 40
+        covered[y:y + TILE, x:x + TILE] = True
+    assert covered[band].all()
+
+
+def test_refined_band_comes_from_the_tiles_and_the_rest_is_kept():
+    image, mask = noise_image(), coarse_mask()
+    remover = RedChannelRemover()
+    refined = refine_mask(remover, image, mask)
+    band = (mask > 16) & (mask < 240)
+    # Feather-blending identical tile predictions gives back the value itself
+    np.testing.assert_array_equal(refined[band], np.asarray(image)[..., 0][band])
+    np.testing.assert_array_equal(refined[~band], mask[~band])
+    assert max(remover.batches) <= settings.BATCH_MAX_SIZE
+
+
+def test_mask_without_uncertain_pixels_skips_the_model():
+    mask = coarse_mask()
+    mask[:, 40:46] = 0
+    remover = RedChannelRemover()
+    assert refine_mask(remover, noise_image(), mask) is mask
+    assert remover.batches == []
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+from PIL import Image
+
+from app.core.scheduler import BatchScheduler
+
+
+class RecordingRemover:
+    """Delegates to the stub remover, records batch sizes and fails any batch containing a 13x13 image"""
+
+    def __init__(self, remover):
+        self.remover = remover
+        self.batches = []
+
+    def select_input_size(self, *args, **kwargs):
+        return self.remover.select_input_size(*args, **kwargs)
+
+    def remove_background_batch(self, images, **kwargs):
+        self.batches.append(len(images))
+        if any(image.size == (13, 13) for image in images):
+            raise RuntimeError("inference failed")
+        return self.remover.remove_background_batch(images, **kwargs)
+
+
+@pytest.fixture
+def remover(stub_remover):
+    return RecordingRemover(stub_remover)
+
+
+@pytest.fixture
+def scheduler(remover):
+    # A long wait so that everything submitted together lands in one batch
+    scheduler = BatchScheduler(remover, max_batch_size=4, max_wait_ms=200)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def test_concurrent_requests_share_one_forward_pass(scheduler, remover):
+    futures = [scheduler.submit(Image.new("RGB", (40, 30)), return_mask=True) for _ in range(3)]
+    for future in futures:
+        result_image, mask_image = future.result(timeout=30)
+        assert result_image.size == mask_image.size == (40, 30)
+    assert remover.batches == [3]
+
+
+def test_failing_image_does_not_fail_its_batch(scheduler, remover):
+    sizes = [(40, 30), (13, 13), (20, 20)]
+    futures = [scheduler.submit(Image.new("RGB", size)) for size in sizes]
+    assert futures[0].result(timeout=30).size == (40, 30)
+    with pytest.raises(RuntimeError):
+        futures[1].result(timeout=30)
+    assert futures[2].result(timeout=30).size == (20, 20)
+    assert remover.batches == [3, 1, 1, 1]
+
+
+def test_call_runs_on_the_worker_thread(scheduler):
+    assert scheduler.call(lambda: threading.current_thread().name).result(timeout=10) == "rmbg-batch-scheduler"